@@ -0,0 +1,57 @@
+import ctypes
+import numpy as np
+import sdl2 as s
+
+FREQUENCY = 44100
+# samples queued ahead of the playback position, about two frames
+QUEUE_AHEAD = FREQUENCY // 30
+VOLUME = 32
+
+
+class Audio:
+    # plays the 128-bit XO-CHIP pattern as a square wave through an SDL audio queue
+    def __init__(self):
+        s.SDL_InitSubSystem(s.SDL_INIT_AUDIO)
+        spec = s.SDL_AudioSpec(FREQUENCY, s.AUDIO_U8, 1, 512)
+        self.device = s.SDL_OpenAudioDevice(None, 0, ctypes.byref(spec), None, 0)
+        self.playing = False
+        self.phase = 0.0
+        self.bits = None
+        self.step = 0.0
+    
+    def set_tone(self, pattern, pitch):
+        self.bits = np.unpackbits(np.frombuffer(bytes(pattern), dtype=np.uint8))
+        # pattern bits per output sample
+        self.step = 4000 * 2 ** ((pitch - 64) / 48) / FREQUENCY
+    
+    def start(self):
+        if self.device == 0:
+            return
+        self.playing = True
+        self.phase = 0.0
+        self.update()
+        s.SDL_PauseAudioDevice(self.device, 0)
+    
+    def stop(self):
+        self.playing = False
+        if self.device == 0:
+            return
+        s.SDL_PauseAudioDevice(self.device, 1)
+        s.SDL_ClearQueuedAudio(self.device)
+    
+    def update(self):
+        # called once a frame while the sound timer runs, tops the queue back up
+        if not self.playing:
+            return
+        count = QUEUE_AHEAD - s.SDL_GetQueuedAudioSize(self.device)
+        if count <= 0:
+            return
+        positions = self.phase + np.arange(count) * self.step
+        self.phase = (self.phase + count * self.step) % len(self.bits)
+        samples = np.where(self.bits[positions.astype(np.int64) % len(self.bits)], 128 + VOLUME, 128 - VOLUME).astype(np.uint8)
+        s.SDL_QueueAudio(self.device, samples.ctypes.data_as(ctypes.c_void_p), count)
+    
+    def destroy(self):
+        if self.device != 0:
+            s.SDL_CloseAudioDevice(self.device)
+            self.device = 0
@@ -0,0 +1,296 @@
+import numpy as np
+from array import array
+from chip8 import Chip8, STACK_DEPTH
+from frameBuffer import FrameBuffer
+from instruction import CHIP8
+from quirks import Quirks
+
+WIDTH = 64
+HEIGHT = 32
+
+
+class BatchChip8:
+    # runs n independent machines in lockstep, one numpy row per machine
+    def __init__(self, n, instructions_per_frame=12, quirks: Quirks = None, seed=None):
+        self.n = n
+        self.instructions_per_frame = instructions_per_frame
+        self.quirks : Quirks = quirks if quirks is not None else Quirks()
+        if self.quirks.opcodes != CHIP8:
+            raise ValueError(f"the batch engine only runs the {CHIP8} instruction set, not {self.quirks.opcodes}")
+        template = Chip8()
+        self.font_offset = template.font_offset
+        self.memory = np.tile(np.frombuffer(bytes(template.memory), dtype=np.uint8), (n, 1))
+        self.registers = np.zeros((n, 16), dtype=np.uint8)
+        self.pc = np.full(n, template.pc, dtype=np.int64)
+        self.index_register = np.full(n, template.index_register, dtype=np.int64)
+        self.stack = np.zeros((n, STACK_DEPTH), dtype=np.int64)
+        self.sp = np.zeros(n, dtype=np.int64)
+        self.delay_timer = np.zeros(n, dtype=np.int64)
+        self.sound_timer = np.zeros(n, dtype=np.int64)
+        self.sound_frames = np.zeros(n, dtype=np.int64)
+        # one uint64 per row, the leftmost pixel is the most significant bit
+        self.framebuffers = np.zeros((n, HEIGHT), dtype=np.uint64)
+        # bit k is set while key k is held
+        self.keys = np.zeros(n, dtype=np.int64)
+        # last key released since FX0A started waiting, -1 when none
+        self.released = np.full(n, -1, dtype=np.int64)
+        # register FX0A is waiting to fill, -1 while running
+        self.waiting = np.full(n, -1, dtype=np.int64)
+        # machines that hit an error the interpreter would raise stop executing
+        self.faulted = np.zeros(n, dtype=bool)
+        self.random = np.random.default_rng(seed)
+        self.frame_count = 0
+    
+    def load_program(self, p):
+        with open(p, "rb") as f:
+            program = np.frombuffer(f.read(), dtype=np.uint8)
+        if len(program) > self.memory.shape[1] - 0x200:
+            raise ValueError(f"{p} is larger than the {self.memory.shape[1] - 0x200} bytes available at 0x200")
+        self.memory[:, 0x200:0x200 + len(program)] = program
+    
+    def press(self, i, key):
+        self.keys[i] |= 1 << key
+    
+    def release(self, i, key):
+        i = np.arange(self.n)[i]
+        held = i[(self.keys[i] >> key) & 1 == 1]
+        self.keys[held] &= ~(1 << key)
+        self.released[held] = key
+    
+    def step_frame(self):
+        resumed = np.nonzero((self.waiting >= 0) & (self.released >= 0))[0]
+        self.registers[resumed, self.waiting[resumed]] = self.released[resumed]
+        self.pc[resumed] += 2
+        self.waiting[resumed] = -1
+        
+        for _ in range(self.instructions_per_frame):
+            self.step()
+        
+        self.delay_timer[self.delay_timer > 0] -= 1
+        sounding = self.sound_timer > 0
+        self.sound_frames[sounding] += 1
+        self.sound_timer[sounding] -= 1
+        self.frame_count += 1
+    
+    def run(self, frames):
+        for _ in range(frames):
+            self.step_frame()
+    
+    def fault(self, i):
+        self.faulted[i] = True
+    
+    def step(self):
+        active = np.nonzero(~self.faulted)[0]
+        pc = self.pc[active]
+        out_of_range = pc + 1 >= self.memory.shape[1]
+        if out_of_range.any():
+            self.fault(active[out_of_range])
+            active = active[~out_of_range]
+            pc = pc[~out_of_range]
+        if len(active) == 0:
+            return
+        
+        opcode = (self.memory[active, pc].astype(np.int64) << 8) | self.memory[active, pc + 1]
+        self.pc[active] = pc + 2
+        
+        hi = opcode >> 12
+        for group in np.flatnonzero(np.bincount(hi, minlength=16)):
+            mask = hi == group
+            i = active[mask]
+            op = opcode[mask]
+            x = (op >> 8) & 0xF
+            y = (op >> 4) & 0xF
+            n = op & 0xF
+            nn = op & 0xFF
+            nnn = op & 0xFFF
+            match group:
+                case 0x0:
+                    clear = n == 0x0
+                    self.framebuffers[i[clear]] = 0
+                    ret = i[n == 0xE]
+                    ret = ret[self.sp[ret] > 0]
+                    self.sp[ret] -= 1
+                    self.pc[ret] = self.stack[ret, self.sp[ret]]
+                case 0x1:
+                    self.pc[i] = nnn
+                case 0x2:
+                    overflow = self.sp[i] >= STACK_DEPTH
+                    self.fault(i[overflow])
+                    i = i[~overflow]
+                    nnn = nnn[~overflow]
+                    self.stack[i, self.sp[i]] = self.pc[i]
+                    self.sp[i] += 1
+                    self.pc[i] = nnn
+                case 0x3:
+                    self.pc[i[self.registers[i, x] == nn]] += 2
+                case 0x4:
+                    self.pc[i[self.registers[i, x] != nn]] += 2
+                case 0x5:
+                    self.pc[i[self.registers[i, x] == self.registers[i, y]]] += 2
+                case 0x6:
+                    self.registers[i, x] = nn
+                case 0x7:
+                    self.registers[i, x] = (self.registers[i, x] + nn) & 0xFF
+                case 0x8:
+                    self.step_arithmetic(i, x, y, n)
+                case 0x9:
+                    self.pc[i[self.registers[i, x] != self.registers[i, y]]] += 2
+                case 0xA:
+                    self.index_register[i] = nnn
+                case 0xB:
+                    self.pc[i] = nnn + self.registers[i, x if self.quirks.jump_uses_vx else 0]
+                case 0xC:
+                    self.registers[i, x] = self.random.integers(0, 256, len(i)) & nn
+                case 0xD:
+                    self.step_display(i, x, y, n)
+                case 0xE:
+                    self.step_keys(i, x, nn)
+                case 0xF:
+                    self.step_misc(i, x, nn)
+    
+    def step_arithmetic(self, i, x, y, n):
+        registers = self.registers
+        for kind in np.flatnonzero(np.bincount(n, minlength=16)):
+            mask = n == kind
+            j = i[mask]
+            jx = x[mask]
+            vx = registers[j, jx].astype(np.int64)
+            vy = registers[j, y[mask]].astype(np.int64)
+            source = vy if self.quirks.shift_uses_vy else vx
+            match kind:
+                case 0x0:
+                    registers[j, jx] = vy
+                case 0x1:
+                    registers[j, jx] = vx | vy
+                    if self.quirks.logic_resets_vf:
+                        registers[j, 0xF] = 0
+                case 0x2:
+                    registers[j, jx] = vx & vy
+                    if self.quirks.logic_resets_vf:
+                        registers[j, 0xF] = 0
+                case 0x3:
+                    registers[j, jx] = vx ^ vy
+                    if self.quirks.logic_resets_vf:
+                        registers[j, 0xF] = 0
+                case 0x4:
+                    z = vx + vy
+                    registers[j, 0xF] = z > 255
+                    registers[j, jx] = z & 0xFF
+                case 0x5:
+                    registers[j, 0xF] = vx >= vy
+                    registers[j, jx] = (vx - vy) & 0xFF
+                case 0x7:
+                    registers[j, 0xF] = vy >= vx
+                    registers[j, jx] = (vy - vx) & 0xFF
+                case 0x6:
+                    registers[j, 0xF] = source & 0x1
+                    registers[j, jx] = source >> 1
+                case 0xE:
+                    registers[j, 0xF] = (source >> 7) & 0x1
+                    registers[j, jx] = (source << 1) & 0xFF
+    
+    def step_display(self, i, x, y, n):
+        registers = self.registers
+        px = registers[i, x].astype(np.int64) % WIDTH
+        py = registers[i, y].astype(np.int64) % HEIGHT
+        ir = self.index_register[i]
+        collision = np.zeros(len(i), dtype=bool)
+        size = self.memory.shape[1]
+        wrap = self.quirks.sprite_wrap
+        for row in range(int(n.max(initial=0))):
+            draw = (row < n) & (ir + row < size)
+            if not wrap:
+                draw &= py + row < HEIGHT
+            if not draw.any():
+                continue
+            j = i[draw]
+            line = self.memory[j, ir[draw] + row].astype(np.uint64)
+            shift = 56 - px[draw]
+            bits = np.where(shift >= 0, line << np.maximum(shift, 0).astype(np.uint64), line >> np.maximum(-shift, 0).astype(np.uint64))
+            if wrap:
+                # the part that falls off the right edge comes back on the left
+                bits |= np.where(shift < 0, line << (WIDTH + np.minimum(shift, 0)).astype(np.uint64), np.uint64(0))
+            target = (py[draw] + row) % HEIGHT
+            current = self.framebuffers[j, target]
+            collision[draw] |= (current & bits) != 0
+            self.framebuffers[j, target] = current ^ bits
+        registers[i, 0xF] = collision
+    
+    def step_keys(self, i, x, nn):
+        vx = self.registers[i, x].astype(np.int64)
+        held = (vx < 16) & ((self.keys[i] >> np.minimum(vx, 15)) & 1 == 1)
+        self.pc[i[(nn == 0x9E) & held]] += 2
+        self.pc[i[(nn == 0xA1) & ~held]] += 2
+    
+    def step_misc(self, i, x, nn):
+        registers = self.registers
+        memory = self.memory
+        size = memory.shape[1]
+        for kind in np.flatnonzero(np.bincount(nn, minlength=256)):
+            mask = nn == kind
+            j = i[mask]
+            jx = x[mask]
+            match kind:
+                case 0x07:
+                    registers[j, jx] = self.delay_timer[j]
+                case 0x15:
+                    self.delay_timer[j] = registers[j, jx]
+                case 0x18:
+                    self.sound_timer[j] = registers[j, jx]
+                case 0x1E:
+                    ir = self.index_register[j] + registers[j, jx]
+                    registers[j, 0xF] = ir > 0x0FFF
+                    self.index_register[j] = ir & 0x0FFF
+                case 0x0A:
+                    start = j[self.waiting[j] < 0]
+                    self.waiting[start] = jx[self.waiting[j] < 0]
+                    self.released[start] = -1
+                    self.pc[j] -= 2
+                case 0x29:
+                    self.index_register[j] = (registers[j, jx] & 0x0F).astype(np.int64) * 5 + self.font_offset
+                case 0x33:
+                    vx = registers[j, jx].astype(np.int64)
+                    ir = self.index_register[j]
+                    digits = np.stack(((vx // 100) % 10, (vx // 10) % 10, vx % 10), axis=1)
+                    for offset in range(3):
+                        ok = ir + offset < size
+                        self.fault(j[~ok])
+                        j, ir, digits = j[ok], ir[ok], digits[ok]
+                        memory[j, ir + offset] = digits[:, offset]
+                case 0x55 | 0x65:
+                    ir = self.index_register[j]
+                    for r in range(int(jx.max(initial=0)) + 1):
+                        copy = r <= jx
+                        ok = ir + r < size
+                        self.fault(j[copy & ~ok])
+                        k = j[copy & ok]
+                        if kind == 0x55:
+                            memory[k, ir[copy & ok] + r] = registers[k, r]
+                        else:
+                            registers[k, r] = memory[k, ir[copy & ok] + r]
+                        # a faulted machine stops copying, like the interpreter raising
+                        keep = ~(copy & ~ok)
+                        j, jx, ir = j[keep], jx[keep], ir[keep]
+                    if self.quirks.load_store_increments_i:
+                        self.index_register[j] = ir + jx + 1
+    
+    def get_chip8(self, i):
+        chip = Chip8()
+        chip.memory[:] = self.memory[i].tobytes()
+        chip.registers[:] = self.registers[i].tobytes()
+        chip.pc = int(self.pc[i])
+        chip.index_register = int(self.index_register[i])
+        chip.sp = int(self.sp[i])
+        chip.stack[:chip.sp] = array("H", self.stack[i, :chip.sp])
+        chip.delay_timer = int(self.delay_timer[i])
+        chip.sound_timer = int(self.sound_timer[i])
+        return chip
+    
+    def get_framebuffer(self, i):
+        framebuffer = FrameBuffer(WIDTH, HEIGHT)
+        framebuffer.rows = [int(row) for row in self.framebuffers[i]]
+        return framebuffer
+    
+    def get_pixels(self):
+        packed = self.framebuffers.astype(">u8").view(np.uint8)
+        return np.unpackbits(packed, axis=1).reshape(self.n, HEIGHT, WIDTH).astype(bool)
@@ -0,0 +1,151 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import chip8
+import headlessDisplay
+import instrucionExecutor
+from profiler import Profiler
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ROM_DIR = os.path.join(ROOT, "roms")
+# the core has to stay importable without these
+MULTIMEDIA_MODULES = ("sdl2", "pygame", "numpy")
+
+
+def make_executor(rom, ipf, jit):
+    chip = chip8.Chip8()
+    chip.load_program(rom)
+    executor = instrucionExecutor.InstructionExecutor(chip, headlessDisplay.HeadlessDisplay(), paced=False, seed=0)
+    executor.instructions_per_frame = ipf
+    if jit:
+        executor.enable_block_compiler()
+    return executor
+
+
+def run_quietly(executor, frames):
+    # unknown opcodes print, keep that out of the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            executor.run(frames)
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+    return None
+
+
+def bench_rom(rom, frames, ipf, jit):
+    executor = make_executor(rom, ipf, jit)
+    start = time.perf_counter()
+    error = run_quietly(executor, frames)
+    elapsed = time.perf_counter() - start
+    # idle loop skips and frames parked on FX0A don't execute anything
+    instructions = executor.instructions_run
+    
+    # instrumented passes for the per-class breakdown and the memory peak,
+    # kept apart so neither skews the other
+    profiler = Profiler(make_executor(rom, ipf, False)).attach()
+    run_quietly(profiler.executor, frames)
+    counts = {t.name: count for t, count in profiler.counts.items()}
+    totals = {t.name: seconds for t, seconds in profiler.times.items()}
+    
+    tracemalloc.start()
+    run_quietly(make_executor(rom, ipf, jit), frames)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    classes = {
+        name: {"count": counts[name], "seconds": totals[name], "ns_per_instruction": totals[name] / counts[name] * 1e9}
+        for name in sorted(counts, key=totals.get, reverse=True)
+    }
+    draw = classes.get("DISPLAY")
+    return {
+        "rom": os.path.basename(rom),
+        "frames": executor.frame_count,
+        "instructions": instructions,
+        "seconds": elapsed,
+        "instructions_per_second": instructions / elapsed if elapsed else 0.0,
+        "frame_time_ms": elapsed / executor.frame_count * 1000 if executor.frame_count else 0.0,
+        "draw_ns": draw["ns_per_instruction"] if draw else 0.0,
+        "draws": draw["count"] if draw else 0,
+        "peak_memory_bytes": peak,
+        "error": error,
+        "classes": classes,
+    }
+
+
+def time_process(command, runs):
+    # best of several fresh interpreters, so every run pays for its imports
+    best = None
+    output = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+
+def bench_startup(rom, runs):
+    interpreter, _ = time_process([sys.executable, "-c", "pass"], runs)
+    core, loaded = time_process([sys.executable, "-c", "import sys, chip8, instrucionExecutor, headlessDisplay; "
+                                 f"print(' '.join(m for m in {MULTIMEDIA_MODULES!r} if m in sys.modules))"], runs)
+    launch, _ = time_process([sys.executable, os.path.join(ROOT, "main.py"), rom, "--headless", "--frames", "1",
+                              "--speed", "unlimited", "--quirks", "default"], runs)
+    return {
+        "interpreter_ms": interpreter * 1000,
+        "core_import_ms": (core - interpreter) * 1000,
+        "headless_launch_ms": launch * 1000,
+        "multimedia_modules": loaded.split(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the emulator over a directory of ROMs")
+    parser.add_argument("roms", nargs="*", help="ROM files, defaults to everything in roms/")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--ipf", type=int, default=1000, help="instructions per frame")
+    parser.add_argument("--jit", action="store_true", help="time the block compiler instead of the interpreter")
+    parser.add_argument("--startup-runs", type=int, default=5, help="fresh interpreters to time startup over, 0 to skip")
+    parser.add_argument("--output", metavar="PATH", help="write the results as JSON to PATH")
+    args = parser.parse_args()
+    
+    roms = args.roms or sorted(glob.glob(os.path.join(ROM_DIR, "*.ch8")))
+    results = []
+    for rom in roms:
+        result = bench_rom(rom, args.frames, args.ipf, args.jit)
+        results.append(result)
+        status = f"  ({result['error']})" if result["error"] else ""
+        print(f"{result['rom'][:32]:32} {result['instructions_per_second']:>12,.0f} ips "
+              f"{result['frame_time_ms']:7.3f} ms/frame {result['draw_ns']:9.0f} ns/draw "
+              f"{result['peak_memory_bytes'] / 1024:8.1f} KiB{status}")
+    
+    startup = None
+    if args.startup_runs > 0 and roms:
+        startup = bench_startup(roms[0], args.startup_runs)
+        loaded = ", ".join(startup["multimedia_modules"]) or "none"
+        print(f"startup: {startup['core_import_ms']:.1f} ms core import, {startup['headless_launch_ms']:.1f} ms headless launch "
+              f"({startup['interpreter_ms']:.1f} ms of it the interpreter), multimedia modules loaded: {loaded}")
+    
+    if args.output:
+        report = {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "frames": args.frames,
+            "instructions_per_frame": args.ipf,
+            "jit": args.jit,
+            "startup": startup,
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
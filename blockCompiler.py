@@ -0,0 +1,283 @@
+from instruction import InstructionType, XOCHIP, decode
+from instrucionExecutor import IdleLoop, WaitForKey
+
+MAX_BLOCK_LENGTH = 64
+
+# instructions that end a block because they change the flow of control
+TERMINATORS = {
+    InstructionType.JUMP,
+    InstructionType.CALL,
+    InstructionType.RETURN,
+    InstructionType.JUMP_EQ_NN,
+    InstructionType.JUMP_NEQ_NN,
+    InstructionType.JUMP_EQ,
+    InstructionType.JUMP_NEQ,
+    InstructionType.JUMP_OFFSET,
+    InstructionType.GET_KEY,
+    InstructionType.SKIP_IF_KEY,
+    InstructionType.SKIP_IF_NOT_KEY,
+    InstructionType.UNKNOWN,
+    # these write memory and may overwrite the rest of the block
+    InstructionType.STORE,
+    InstructionType.BINARY_CODED_DECIMAL,
+    InstructionType.SAVE_RANGE,
+    InstructionType.EXIT,
+    # reads the word after it as an operand
+    InstructionType.LONG_INDEX,
+}
+
+SKIPS = {
+    InstructionType.JUMP_EQ_NN,
+    InstructionType.JUMP_NEQ_NN,
+    InstructionType.JUMP_EQ,
+    InstructionType.JUMP_NEQ,
+}
+
+
+class BlockCompiler:
+    def __init__(self, executor):
+        self.executor = executor
+        self.chip8 = executor.chip8
+        # start address -> (function, instruction count, end address)
+        self.blocks = {}
+        # number of compiled blocks covering each byte of memory
+        self.coverage = bytearray(4096)
+    
+    def reset(self):
+        self.blocks.clear()
+        self.coverage = bytearray(4096)
+    
+    def run(self, count):
+        # returns how many instructions ran
+        budget = count
+        chip8 = self.chip8
+        blocks = self.blocks
+        step = self.executor.step
+        while count > 0:
+            pc = chip8.pc
+            block = blocks.get(pc)
+            if block is None:
+                block = self.compile(pc)
+            
+            if 0 < block[1] <= count:
+                count -= block[0](count)
+                if self.executor.waiting_register is not None:
+                    break
+            else:
+                try:
+                    step()
+                except IdleLoop:
+                    # the jump has run; compiled loops already spin cheaply, so don't skip ahead
+                    pass
+                except WaitForKey:
+                    count -= 1
+                    break
+                count -= 1
+        return budget - count
+    
+    def invalidate(self, address, length):
+        coverage = self.coverage
+        end = address + length
+        if not any(coverage[address:end]):
+            return
+        for start, block in list(self.blocks.items()):
+            if start < end and address < block[2]:
+                del self.blocks[start]
+                for i in range(start, block[2]):
+                    coverage[i] -= 1
+    
+    def prewarm(self, starts):
+        for start in starts:
+            if start not in self.blocks:
+                self.compile(start)
+    
+    def compile(self, start):
+        memory = self.chip8.memory
+        generator = BlockGenerator(self.executor)
+        pc = start
+        while pc + 1 < len(memory) and generator.length < MAX_BLOCK_LENGTH:
+            ins = decode((memory[pc] << 8) | memory[pc + 1], self.executor.quirks.opcodes)
+            pc += 2
+            generator.emit(ins, pc)
+            if ins.t in TERMINATORS:
+                break
+        else:
+            generator.finish(pc)
+        
+        block = (generator.build(start), generator.length, pc)
+        self.blocks[start] = block
+        for i in range(start, pc):
+            self.coverage[i] += 1
+        return block
+
+
+class BlockGenerator:
+    def __init__(self, executor):
+        self.executor = executor
+        self.lines = []
+        self.handlers = []
+        self.length = 0
+        self.loaded = set()
+        self.dirty = set()
+        self.index_loaded = False
+        self.index_dirty = False
+    
+    def reg(self, r):
+        if r not in self.loaded:
+            self.lines.append(f"v{r:x} = registers[{r}]")
+            self.loaded.add(r)
+        return f"v{r:x}"
+    
+    def assign(self, r, expression):
+        self.lines.append(f"v{r:x} = {expression}")
+        self.loaded.add(r)
+        self.dirty.add(r)
+    
+    def index(self):
+        if not self.index_loaded:
+            self.lines.append("ir = chip8.index_register")
+            self.index_loaded = True
+        return "ir"
+    
+    def flush(self):
+        for r in sorted(self.dirty):
+            self.lines.append(f"registers[{r}] = v{r:x}")
+        self.dirty.clear()
+        if self.index_dirty:
+            self.lines.append("chip8.index_register = ir")
+            self.index_dirty = False
+    
+    def finish(self, next_pc):
+        self.flush()
+        self.lines.append(f"chip8.pc = {next_pc}")
+    
+    def fallback(self, ins, next_pc):
+        # hand the instruction to the interpreter's prebound handler
+        handler = self.executor.decode_table[ins.opcode]
+        if handler is None:
+            handler = self.executor.decode(ins.opcode)
+        name = f"h{len(self.handlers)}"
+        self.handlers.append((name, handler))
+        self.finish(next_pc)
+        if ins.t == InstructionType.GET_KEY:
+            # FX0A ends the block, and the frame, once it starts waiting
+            self.lines += ["try:", f"    {name}()", "except WaitForKey:", f"    return executed + {self.length}"]
+        else:
+            self.lines.append(f"{name}()")
+        self.loaded.clear()
+        self.index_loaded = False
+    
+    def emit(self, ins, next_pc):
+        self.length += 1
+        x = ins.lower_b1
+        y = ins.upper_b2
+        nn = ins.b2
+        nnn = ins.nnn
+        quirks = self.executor.quirks
+        if quirks.opcodes == XOCHIP and ins.t in SKIPS:
+            # the skip length depends on the next instruction, leave it to the interpreter
+            self.fallback(ins, next_pc)
+            return
+        match ins.t:
+            case InstructionType.SET_REGISTER:
+                self.assign(x, nn)
+            case InstructionType.ADD_REGISTER:
+                self.assign(x, f"({self.reg(x)} + {nn}) & 0xFF")
+            case InstructionType.COPY:
+                self.assign(x, self.reg(y))
+            case InstructionType.BINARY_OR:
+                self.assign(x, f"{self.reg(x)} | {self.reg(y)}")
+                if quirks.logic_resets_vf:
+                    self.assign(0xf, 0)
+            case InstructionType.BINARY_AND:
+                self.assign(x, f"{self.reg(x)} & {self.reg(y)}")
+                if quirks.logic_resets_vf:
+                    self.assign(0xf, 0)
+            case InstructionType.LOGICAL_XOR:
+                self.assign(x, f"{self.reg(x)} ^ {self.reg(y)}")
+                if quirks.logic_resets_vf:
+                    self.assign(0xf, 0)
+            case InstructionType.ADD:
+                self.lines.append(f"t = {self.reg(x)} + {self.reg(y)}")
+                self.assign(0xf, "t >> 8")
+                self.assign(x, "t & 0xFF")
+            case InstructionType.SUBTRACT:
+                self.lines.append(f"a = {self.reg(x)}")
+                self.lines.append(f"b = {self.reg(y)}")
+                self.assign(0xf, "1 if a >= b else 0")
+                self.assign(x, "(a - b) & 0xFF")
+            case InstructionType.ISUBTRACT:
+                self.lines.append(f"a = {self.reg(x)}")
+                self.lines.append(f"b = {self.reg(y)}")
+                self.assign(0xf, "1 if b >= a else 0")
+                self.assign(x, "(b - a) & 0xFF")
+            case InstructionType.RSHIFT:
+                source = y if quirks.shift_uses_vy else x
+                self.lines.append(f"a = {self.reg(source)}")
+                self.assign(0xf, "a & 0x1")
+                self.assign(x, "a >> 1")
+            case InstructionType.LSHIFT:
+                source = y if quirks.shift_uses_vy else x
+                self.lines.append(f"a = {self.reg(source)}")
+                self.assign(0xf, "a >> 7")
+                self.assign(x, "(a << 1) & 0xFF")
+            case InstructionType.SET_INDEX_REGISTER:
+                self.lines.append(f"ir = {nnn}")
+                self.index_loaded = True
+                self.index_dirty = True
+            case InstructionType.ADD_INDEX:
+                self.lines.append(f"ir = {self.index()} + {self.reg(x)}")
+                self.assign(0xf, "1 if ir > 0x0FFF else 0")
+                self.lines.append("ir &= 0x0FFF")
+                self.index_dirty = True
+            case InstructionType.FONT:
+                self.lines.append(f"ir = ({self.reg(x)} & 0x0F) * 5 + chip8.font_offset")
+                self.index_loaded = True
+                self.index_dirty = True
+            case InstructionType.READ_DELAY_TIMER:
+                self.assign(x, "chip8.delay_timer")
+            case InstructionType.SET_DELAY_TIMER:
+                self.lines.append(f"chip8.delay_timer = {self.reg(x)}")
+            case InstructionType.SET_BEAP_TIMER:
+                self.lines.append(f"chip8.sound_timer = {self.reg(x)}")
+            case InstructionType.JUMP:
+                self.finish(nnn)
+            case InstructionType.JUMP_OFFSET:
+                self.lines.append(f"t = {nnn} + {self.reg(x if quirks.jump_uses_vx else 0)}")
+                self.finish("t")
+            case InstructionType.CALL:
+                self.fallback(ins, next_pc)
+            case InstructionType.JUMP_EQ_NN:
+                self.lines.append(f"t = {next_pc + 2} if {self.reg(x)} == {nn} else {next_pc}")
+                self.finish("t")
+            case InstructionType.JUMP_NEQ_NN:
+                self.lines.append(f"t = {next_pc + 2} if {self.reg(x)} != {nn} else {next_pc}")
+                self.finish("t")
+            case InstructionType.JUMP_EQ:
+                self.lines.append(f"t = {next_pc + 2} if {self.reg(x)} == {self.reg(y)} else {next_pc}")
+                self.finish("t")
+            case InstructionType.JUMP_NEQ:
+                self.lines.append(f"t = {next_pc + 2} if {self.reg(x)} != {self.reg(y)} else {next_pc}")
+                self.finish("t")
+            case _:
+                self.fallback(ins, next_pc)
+    
+    def build(self, start):
+        # blocks that branch back to their own start keep looping while the budget allows
+        length = self.length
+        body = "\n".join("            " + line for line in self.lines)
+        source = (
+            f"def make({', '.join(['chip8'] + [name for name, _ in self.handlers])}):\n"
+            f"    def block_{start:03x}(budget):\n"
+            f"        registers = chip8.registers\n"
+            f"        executed = 0\n"
+            f"        while True:\n"
+            f"{body}\n"
+            f"            executed += {length}\n"
+            f"            if chip8.pc != {start} or executed + {length} > budget:\n"
+            f"                return executed\n"
+            f"    return block_{start:03x}\n"
+        )
+        namespace = {"WaitForKey": WaitForKey}
+        exec(compile(source, f"<block {start:#05x}>", "exec"), namespace)
+        return namespace["make"](self.executor.chip8, *[handler for _, handler in self.handlers])
@@ -1,21 +1,40 @@
+MEMORY_SIZE = 4096
+STACK_DEPTH = 16
+# layout of Chip8.state: memory, then V0-VF, then the 16-bit stack entries
+REGISTERS_OFFSET = MEMORY_SIZE
+STACK_OFFSET = REGISTERS_OFFSET + 16
+STATE_SIZE = STACK_OFFSET + 2 * STACK_DEPTH
+
+
 class Chip8:
+    __slots__ = ("state", "memory", "registers", "stack", "sp", "pc", "index_register",
+                 "delay_timer", "sound_timer", "font_offset", "big_font_offset")
+    
     def __init__(self):
-        self.memory = bytearray(4096)
+        # memory, registers and stack are views of one buffer, so copying a machine is a single copy
+        self.state = bytearray(STATE_SIZE)
+        view = memoryview(self.state)
+        self.memory = view[:MEMORY_SIZE]
+        self.registers = view[REGISTERS_OFFSET:STACK_OFFSET]
+        self.stack = view[STACK_OFFSET:].cast("H")
+        self.sp = 0
         self.pc = 0x200
-        self.stack = []
         self.delay_timer = 0
         self.sound_timer = 0
-        self.registers = bytearray(16)
         self.index_register = 0x200
         self.font_offset = 0x50
+        self.big_font_offset = 0xA0
         self.load_font()
     
     def load_program(self, p):
+        space = len(self.memory) - self.pc
         with open(p, "rb") as f:
-            offset = self.pc
-            for byte in iter(lambda: f.read(1), b''):
-                self.memory[offset] = byte[0]
-                offset += 1
+            # one byte more than fits, so oversized ROMs are caught without reading all of them
+            program = f.read(space + 1)
+        if len(program) > space:
+            raise ValueError(f"{p} is larger than the {space} bytes available at {self.pc:#05x}")
+        self.memory[self.pc:self.pc + len(program)] = program
+        return program
 
     
     def load_font(self):
@@ -40,4 +59,24 @@ class Chip8:
 
         for f in font:
             self.memory[offset] = f
-            offset += 1
\ No newline at end of file
+            offset += 1
+        
+        # SUPER-CHIP 8x10 digits for FX30
+        big_font = [0x3C, 0x7E, 0xE7, 0xC3, 0xC3, 0xC3, 0xC3, 0xE7, 0x7E, 0x3C,
+            0x18, 0x38, 0x58, 0x18, 0x18, 0x18, 0x18, 0x18, 0x18, 0x3C,
+            0x3E, 0x7F, 0xC3, 0x06, 0x0C, 0x18, 0x30, 0x60, 0xFF, 0xFF,
+            0x3C, 0x7E, 0xC3, 0x03, 0x0E, 0x0E, 0x03, 0xC3, 0x7E, 0x3C,
+            0x06, 0x0E, 0x1E, 0x36, 0x66, 0xC6, 0xFF, 0xFF, 0x06, 0x06,
+            0xFF, 0xFF, 0xC0, 0xC0, 0xFC, 0xFE, 0x03, 0xC3, 0x7E, 0x3C,
+            0x3E, 0x7C, 0xE0, 0xC0, 0xFC, 0xFE, 0xC3, 0xC3, 0x7E, 0x3C,
+            0xFF, 0xFF, 0x03, 0x06, 0x0C, 0x18, 0x30, 0x60, 0x60, 0x60,
+            0x3C, 0x7E, 0xC3, 0xC3, 0x7E, 0x7E, 0xC3, 0xC3, 0x7E, 0x3C,
+            0x3C, 0x7E, 0xC3, 0xC3, 0x7F, 0x3F, 0x03, 0x03, 0x3E, 0x7C,
+            0x18, 0x3C, 0x66, 0xC3, 0xC3, 0xFF, 0xFF, 0xC3, 0xC3, 0xC3,
+            0xFC, 0xFE, 0xC3, 0xC3, 0xFE, 0xFE, 0xC3, 0xC3, 0xFE, 0xFC,
+            0x3C, 0x7E, 0xC3, 0xC0, 0xC0, 0xC0, 0xC0, 0xC3, 0x7E, 0x3C,
+            0xFC, 0xFE, 0xC3, 0xC3, 0xC3, 0xC3, 0xC3, 0xC3, 0xFE, 0xFC,
+            0xFF, 0xFF, 0xC0, 0xC0, 0xFC, 0xFC, 0xC0, 0xC0, 0xFF, 0xFF,
+            0xFF, 0xFF, 0xC0, 0xC0, 0xFC, 0xFC, 0xC0, 0xC0, 0xC0, 0xC0 ]
+        
+        self.memory[self.big_font_offset:self.big_font_offset + len(big_font)] = bytes(big_font)
\ No newline at end of file
@@ -0,0 +1,292 @@
+import json
+import select
+import socket
+import time
+from disassembler import mnemonic
+from instruction import InstructionType, decode
+from instrucionExecutor import FRAME_RATE, IdleLoop, WaitForKey
+
+
+class Debugger:
+    # drives the executor one instruction at a time, so the normal frame loop never checks anything
+    def __init__(self, executor):
+        self.executor = executor
+        self.breakpoints = set()
+        # address -> value after the last write, watchpoints stop on every write even if the value is the same
+        self.memory_watches = {}
+        # register -> value after the last write
+        self.register_watches = {}
+        # instructions left in a frame that a stop interrupted
+        self.remaining = 0
+        self.in_frame = False
+        # whether execution is parked after a stop, rather than never started
+        self.stopped = False
+        self.deadline = None
+        # called between frames while running freely, a true result stops with reason "interrupt"
+        self.interrupted = None
+    
+    def add_breakpoint(self, address):
+        self.breakpoints.add(address)
+    
+    def remove_breakpoint(self, address):
+        self.breakpoints.discard(address)
+    
+    def watch_memory(self, address):
+        self.memory_watches[address] = self.executor.chip8.memory[address]
+    
+    def unwatch_memory(self, address):
+        self.memory_watches.pop(address, None)
+    
+    def watch_register(self, register):
+        self.register_watches[register] = self.executor.chip8.registers[register]
+    
+    def unwatch_register(self, register):
+        self.register_watches.pop(register, None)
+    
+    def step(self, count=1):
+        return self.resume(instructions=count)
+    
+    def run_to_frame(self, frame):
+        return self.resume(frame=frame)
+    
+    def resume(self, instructions=None, frame=None, paced=False):
+        executor = self.executor
+        chip8 = executor.chip8
+        # the instruction a previous stop left us on doesn't break again
+        first = self.stopped
+        while True:
+            if not self.in_frame:
+                if frame is not None and executor.frame_count >= frame:
+                    return self.stop("frame")
+                if instructions is None and self.interrupted is not None and self.interrupted():
+                    return self.stop("interrupt")
+                waiting = executor.waiting_register
+                if not executor.begin_frame():
+                    return self.stop("quit")
+                self.in_frame = True
+                executor.last_loop_state = None
+                self.remaining = executor.instructions_per_frame if executor.waiting_register is None else 0
+                # FX0A finishing writes the released key into its register
+                if waiting is not None and executor.waiting_register is None:
+                    watch = self.written_watch((waiting,), ())
+                    if watch is not None:
+                        return self.stop("watchpoint", watch)
+    
+            while self.remaining > 0:
+                if instructions == 0:
+                    return self.stop("step")
+                if chip8.pc in self.breakpoints and not first:
+                    return self.stop("breakpoint")
+                first = False
+                registers, addresses = self.writes() if self.memory_watches or self.register_watches else ((), ())
+                try:
+                    executor.step()
+                except IdleLoop:
+                    # the jump has already run, just don't skip ahead
+                    pass
+                except WaitForKey:
+                    # the rest of the frame is spent waiting
+                    self.remaining = 1
+                self.remaining -= 1
+                if instructions is not None:
+                    instructions -= 1
+                watch = self.written_watch(registers, addresses)
+                if watch is not None:
+                    return self.stop("watchpoint", watch)
+    
+            self.in_frame = False
+            if not executor.end_frame():
+                return self.stop("exit")
+            if instructions is not None and executor.waiting_register is not None:
+                # FX0A blocks until a key is released, stepping can't get any further
+                return self.stop("waiting")
+            if paced:
+                self.pace()
+    
+    def pace(self):
+        now = time.perf_counter()
+        if self.deadline is None or now - self.deadline > 1 / FRAME_RATE:
+            self.deadline = now
+        self.deadline += 1 / FRAME_RATE
+        remaining = self.deadline - now
+        if remaining > 0:
+            time.sleep(remaining)
+    
+    def writes(self):
+        # (registers, memory addresses) the instruction at pc writes, worked out before it runs
+        executor = self.executor
+        chip8 = executor.chip8
+        pc = chip8.pc
+        if pc + 1 >= len(chip8.memory):
+            return (), ()
+        ins = decode((chip8.memory[pc] << 8) | chip8.memory[pc + 1], executor.quirks.opcodes)
+        x = ins.lower_b1
+        y = ins.upper_b2
+        ir = chip8.index_register
+        match ins.t:
+            case (InstructionType.SET_REGISTER | InstructionType.ADD_REGISTER | InstructionType.COPY |
+                  InstructionType.RANDOM | InstructionType.READ_DELAY_TIMER):
+                return (x,), ()
+            case InstructionType.BINARY_OR | InstructionType.BINARY_AND | InstructionType.LOGICAL_XOR:
+                return ((x, 0xF) if executor.quirks.logic_resets_vf else (x,)), ()
+            case (InstructionType.ADD | InstructionType.SUBTRACT | InstructionType.ISUBTRACT |
+                  InstructionType.RSHIFT | InstructionType.LSHIFT):
+                return (x, 0xF), ()
+            case InstructionType.DISPLAY | InstructionType.DISPLAY_LARGE | InstructionType.ADD_INDEX:
+                return (0xF,), ()
+            case InstructionType.LOAD | InstructionType.LOAD_FLAGS:
+                return range(x + 1), ()
+            case InstructionType.LOAD_RANGE:
+                return range(min(x, y), max(x, y) + 1), ()
+            case InstructionType.STORE:
+                return (), range(ir, ir + x + 1)
+            case InstructionType.BINARY_CODED_DECIMAL:
+                return (), range(ir, ir + 3)
+            case InstructionType.SAVE_RANGE:
+                return (), range(ir, ir + abs(y - x) + 1)
+        return (), ()
+    
+    def written_watch(self, registers, addresses):
+        # every watch written is brought up to date, the first one is reported
+        watch = None
+        memory = self.executor.chip8.memory
+        for address in addresses:
+            if address in self.memory_watches:
+                old = self.memory_watches[address]
+                self.memory_watches[address] = memory[address]
+                watch = watch or {"memory": address, "old": old, "new": memory[address]}
+        values = self.executor.chip8.registers
+        for register in registers:
+            if register in self.register_watches:
+                old = self.register_watches[register]
+                self.register_watches[register] = values[register]
+                watch = watch or {"register": register, "old": old, "new": values[register]}
+        return watch
+    
+    def stop(self, reason, detail=None):
+        self.stopped = True
+        stop = {"reason": reason, "pc": self.executor.chip8.pc, "frame": self.executor.frame_count}
+        if detail is not None:
+            stop["watch"] = detail
+        return stop
+    
+    def detach(self):
+        # finish an interrupted frame so executor.run() can carry on from a frame boundary
+        executor = self.executor
+        if self.in_frame:
+            executor.run_instructions(self.remaining)
+            self.remaining = 0
+            self.in_frame = False
+            executor.end_frame()
+    
+    def state(self):
+        executor = self.executor
+        chip8 = executor.chip8
+        pc = chip8.pc
+        ins = decode((chip8.memory[pc] << 8) | chip8.memory[pc + 1], executor.quirks.opcodes)
+        return {
+            "pc": pc,
+            "index_register": chip8.index_register,
+            "registers": list(chip8.registers),
+            "stack": chip8.stack[:chip8.sp].tolist(),
+            "delay_timer": chip8.delay_timer,
+            "sound_timer": chip8.sound_timer,
+            "frame": executor.frame_count,
+            "in_frame": self.in_frame,
+            "remaining": self.remaining,
+            "waiting_register": executor.waiting_register,
+            "keys": executor.keypad.state,
+            "next": f"{ins.opcode:04X} {mnemonic(ins)}",
+        }
+
+
+class DebugServer:
+    # one JSON object per line in each direction, e.g. {"cmd": "break", "address": 512}
+    # any request that arrives while "continue" runs stops it between frames, "pause" does nothing else
+    def __init__(self, debugger, host="127.0.0.1", port=6502):
+        self.debugger = debugger
+        self.host = host
+        self.port = port
+        self.connection = None
+        # bytes received but not yet handled, read by hand so a waiting request can be seen mid-run
+        self.pending = b""
+    
+    def serve(self):
+        # returns True when the client detached and the ROM should keep running
+        self.debugger.interrupted = self.has_request
+        with socket.create_server((self.host, self.port)) as server:
+            while True:
+                connection, _ = server.accept()
+                with connection:
+                    self.connection = connection
+                    self.pending = b""
+                    while (line := self.read_line()) is not None:
+                        if not line.strip():
+                            continue
+                        try:
+                            reply = self.handle(json.loads(line))
+                        except (ValueError, KeyError, TypeError, IndexError) as e:
+                            reply = {"error": f"{type(e).__name__}: {e}"}
+                        connection.sendall((json.dumps(reply) + "\n").encode())
+                        if reply.get("reason") in ("quit", "exit"):
+                            return False
+                        if reply.get("detached"):
+                            return True
+                    self.connection = None
+    
+    def read_line(self):
+        while b"\n" not in self.pending:
+            data = self.connection.recv(4096)
+            if not data:
+                # a last line without a newline still counts
+                line = self.pending
+                self.pending = b""
+                return line.decode() if line.strip() else None
+            self.pending += data
+        line, self.pending = self.pending.split(b"\n", 1)
+        return line.decode()
+    
+    def has_request(self):
+        if self.connection is None:
+            return False
+        if b"\n" in self.pending:
+            return True
+        # a closed connection reads as ready too, so the run stops and serve() sees the client left
+        readable, _, _ = select.select([self.connection], [], [], 0)
+        return bool(readable)
+    
+    def handle(self, request):
+        debugger = self.debugger
+        chip8 = debugger.executor.chip8
+        match request["cmd"]:
+            case "break":
+                debugger.add_breakpoint(request["address"])
+            case "unbreak":
+                debugger.remove_breakpoint(request["address"])
+            case "watch" if "register" in request:
+                debugger.watch_register(request["register"])
+            case "watch":
+                debugger.watch_memory(request["address"])
+            case "unwatch" if "register" in request:
+                debugger.unwatch_register(request["register"])
+            case "unwatch":
+                debugger.unwatch_memory(request["address"])
+            case "step":
+                return debugger.step(request.get("count", 1))
+            case "continue":
+                return debugger.resume(frame=request.get("frame"), paced=request.get("paced", False))
+            case "frame":
+                return debugger.run_to_frame(request["frame"])
+            case "state":
+                return debugger.state()
+            case "memory":
+                address = request["address"]
+                return {"address": address, "data": bytes(chip8.memory[address:address + request.get("length", 16)]).hex()}
+            case "pause":
+                pass
+            case "detach":
+                debugger.detach()
+                return {"detached": True}
+            case command:
+                raise ValueError(f"unknown command {command!r}")
+        return {"ok": True}
@@ -0,0 +1,293 @@
+import argparse
+from chip8 import Chip8
+from instruction import InstructionType, CHIP8, XOCHIP, decode
+import quirks
+
+# Cowgod style mnemonics, filled in with x, y, n, nn and nnn
+MNEMONICS = {
+    InstructionType.CLEAR: "CLS",
+    InstructionType.RETURN: "RET",
+    InstructionType.JUMP: "JP {nnn:03X}",
+    InstructionType.CALL: "CALL {nnn:03X}",
+    InstructionType.JUMP_EQ_NN: "SE V{x:X}, {nn:#04x}",
+    InstructionType.JUMP_NEQ_NN: "SNE V{x:X}, {nn:#04x}",
+    InstructionType.JUMP_EQ: "SE V{x:X}, V{y:X}",
+    InstructionType.JUMP_NEQ: "SNE V{x:X}, V{y:X}",
+    InstructionType.SET_REGISTER: "LD V{x:X}, {nn:#04x}",
+    InstructionType.ADD_REGISTER: "ADD V{x:X}, {nn:#04x}",
+    InstructionType.COPY: "LD V{x:X}, V{y:X}",
+    InstructionType.BINARY_OR: "OR V{x:X}, V{y:X}",
+    InstructionType.BINARY_AND: "AND V{x:X}, V{y:X}",
+    InstructionType.LOGICAL_XOR: "XOR V{x:X}, V{y:X}",
+    InstructionType.ADD: "ADD V{x:X}, V{y:X}",
+    InstructionType.SUBTRACT: "SUB V{x:X}, V{y:X}",
+    InstructionType.RSHIFT: "SHR V{x:X}, V{y:X}",
+    InstructionType.ISUBTRACT: "SUBN V{x:X}, V{y:X}",
+    InstructionType.LSHIFT: "SHL V{x:X}, V{y:X}",
+    InstructionType.SET_INDEX_REGISTER: "LD I, {nnn:03X}",
+    InstructionType.JUMP_OFFSET: "JP V0, {nnn:03X}",
+    InstructionType.RANDOM: "RND V{x:X}, {nn:#04x}",
+    InstructionType.DISPLAY: "DRW V{x:X}, V{y:X}, {n}",
+    InstructionType.SKIP_IF_KEY: "SKP V{x:X}",
+    InstructionType.SKIP_IF_NOT_KEY: "SKNP V{x:X}",
+    InstructionType.READ_DELAY_TIMER: "LD V{x:X}, DT",
+    InstructionType.GET_KEY: "LD V{x:X}, K",
+    InstructionType.SET_DELAY_TIMER: "LD DT, V{x:X}",
+    InstructionType.SET_BEAP_TIMER: "LD ST, V{x:X}",
+    InstructionType.ADD_INDEX: "ADD I, V{x:X}",
+    InstructionType.FONT: "LD F, V{x:X}",
+    InstructionType.BINARY_CODED_DECIMAL: "LD B, V{x:X}",
+    InstructionType.STORE: "LD [I], V{x:X}",
+    InstructionType.LOAD: "LD V{x:X}, [I]",
+    InstructionType.SCROLL_DOWN: "SCD {n}",
+    InstructionType.SCROLL_RIGHT: "SCR",
+    InstructionType.SCROLL_LEFT: "SCL",
+    InstructionType.EXIT: "EXIT",
+    InstructionType.LORES: "LOW",
+    InstructionType.HIRES: "HIGH",
+    InstructionType.DISPLAY_LARGE: "DRW V{x:X}, V{y:X}, 0",
+    InstructionType.BIG_FONT: "LD HF, V{x:X}",
+    InstructionType.SAVE_FLAGS: "LD R, V{x:X}",
+    InstructionType.LOAD_FLAGS: "LD V{x:X}, R",
+    InstructionType.SCROLL_UP: "SCU {n}",
+    InstructionType.SAVE_RANGE: "SAVE V{x:X} - V{y:X}",
+    InstructionType.LOAD_RANGE: "LOAD V{x:X} - V{y:X}",
+    InstructionType.LONG_INDEX: "LD I, LONG",
+    InstructionType.SELECT_PLANE: "PLANE {x}",
+    InstructionType.LOAD_AUDIO: "AUDIO",
+    InstructionType.SET_PITCH: "PITCH V{x:X}",
+}
+
+SKIPS = {
+    InstructionType.JUMP_EQ_NN,
+    InstructionType.JUMP_NEQ_NN,
+    InstructionType.JUMP_EQ,
+    InstructionType.JUMP_NEQ,
+    InstructionType.SKIP_IF_KEY,
+    InstructionType.SKIP_IF_NOT_KEY,
+}
+
+# instructions that end a path through the ROM, unknown opcodes fall through like in the interpreter
+STOPS = {
+    InstructionType.RETURN,
+    InstructionType.EXIT,
+}
+
+
+def mnemonic(ins):
+    template = MNEMONICS.get(ins.t)
+    if template is None:
+        return f"DW {ins.opcode:#06x}"
+    return template.format(x=ins.lower_b1, y=ins.upper_b2, n=ins.lower_b2, nn=ins.b2, nnn=ins.nnn)
+
+
+class BasicBlock:
+    def __init__(self, start):
+        self.start = start
+        self.end = start
+        # (address, Instruction) in execution order
+        self.instructions = []
+        # blocks control can continue in, the return site for a CALL
+        self.successors = []
+        # subroutines called from the last instruction
+        self.calls = []
+    
+    def __repr__(self):
+        return f"BasicBlock({self.start:#05x}-{self.end:#05x})"
+
+
+class Analysis:
+    def __init__(self, memory, start, end, opcodes):
+        self.memory = memory
+        self.start = start
+        self.end = end
+        self.opcodes = opcodes
+        # address -> Instruction for every instruction reachable from the entry points
+        self.instructions = {}
+        # address -> addresses control can go to next
+        self.successors = {}
+        self.jump_targets = set()
+        self.subroutines = set()
+        # addresses loaded into I, usually sprites
+        self.data_refs = set()
+        # BNNN jumps, whose targets depend on V0 and can't be followed
+        self.indirect = set()
+        # start address -> BasicBlock
+        self.blocks = {}
+    
+    @property
+    def code(self):
+        return self.instructions.keys()
+    
+    def is_code(self, address):
+        return address in self.instructions or address - 1 in self.instructions
+    
+    def word(self, address):
+        return (self.memory[address] << 8) | self.memory[address + 1]
+    
+    def explore(self, entries):
+        memory_end = len(self.memory) - 1
+        pending = list(entries)
+        while pending:
+            pc = pending.pop()
+            if pc in self.instructions or pc >= memory_end:
+                continue
+            ins = decode(self.word(pc), self.opcodes)
+            self.instructions[pc] = ins
+    
+            following = pc + 2
+            if ins.t in SKIPS:
+                skipped = 4 if self.opcodes == XOCHIP and following < memory_end and self.word(following) == 0xF000 else 2
+                successors = [following, following + skipped]
+            elif ins.t == InstructionType.JUMP:
+                successors = [ins.nnn]
+                self.jump_targets.add(ins.nnn)
+            elif ins.t == InstructionType.CALL:
+                successors = [following]
+                self.subroutines.add(ins.nnn)
+                pending.append(ins.nnn)
+            elif ins.t == InstructionType.JUMP_OFFSET:
+                successors = []
+                self.indirect.add(pc)
+            elif ins.t == InstructionType.LONG_INDEX:
+                successors = [following + 2]
+                if following < memory_end:
+                    self.data_refs.add(self.word(following))
+            elif ins.t in STOPS:
+                successors = []
+            else:
+                successors = [following]
+    
+            if ins.t == InstructionType.SET_INDEX_REGISTER:
+                self.data_refs.add(ins.nnn)
+            self.successors[pc] = successors
+            pending.extend(successors)
+    
+    def split_blocks(self, entries):
+        leaders = set(entries) | self.jump_targets | self.subroutines
+        for pc, successors in self.successors.items():
+            if successors != [pc + 2] or self.instructions[pc].t == InstructionType.CALL:
+                leaders.update(successors)
+    
+        for leader in sorted(leaders):
+            if leader not in self.instructions:
+                continue
+            block = BasicBlock(leader)
+            pc = leader
+            while True:
+                ins = self.instructions[pc]
+                block.instructions.append((pc, ins))
+                successors = self.successors[pc]
+                if ins.t == InstructionType.CALL:
+                    block.calls.append(ins.nnn)
+                if successors != [pc + 2] or ins.t == InstructionType.CALL or pc + 2 in leaders or pc + 2 not in self.instructions:
+                    block.successors = [s for s in successors if s in self.instructions]
+                    break
+                pc += 2
+            block.end = pc + 2
+            self.blocks[leader] = block
+    
+    def data_ranges(self):
+        # runs of ROM bytes that no reachable instruction covers
+        ranges = []
+        start = None
+        for address in range(self.start, self.end):
+            if self.is_code(address):
+                if start is not None:
+                    ranges.append((start, address))
+                    start = None
+            elif start is None or address in self.data_refs:
+                if start is not None:
+                    ranges.append((start, address))
+                start = address
+        if start is not None:
+            ranges.append((start, self.end))
+        return ranges
+    
+    def label(self, address):
+        if address in self.subroutines:
+            return f"S{address:03X}"
+        if address in self.jump_targets or address in self.blocks:
+            return f"L{address:03X}"
+        if address in self.data_refs:
+            return f"D{address:03X}"
+        return None
+    
+    def listing(self):
+        lines = []
+        data = {start: end for start, end in self.data_ranges()}
+        address = self.start
+        last = max([self.end] + [pc + 2 for pc in self.instructions])
+        while address < last:
+            label = self.label(address)
+            if label is not None:
+                lines.append(f"{label}:")
+            if address in self.instructions:
+                ins = self.instructions[address]
+                comment = ""
+                if ins.t == InstructionType.SET_INDEX_REGISTER:
+                    comment = f"  ; {self.label(ins.nnn)}"
+                elif address in self.indirect:
+                    comment = "  ; indirect, targets unknown"
+                lines.append(f"  {address:03X}: {ins.opcode:04X}  {mnemonic(ins):<20}{comment}".rstrip())
+                address += 2
+            elif address in data:
+                for byte_address in range(address, data[address]):
+                    byte = self.memory[byte_address]
+                    sprite = f"{byte:08b}".replace("0", ".").replace("1", "#")
+                    lines.append(f"  {byte_address:03X}: {byte:02X}    db {byte:#04x}            ; {sprite}")
+                address = data[address]
+            else:
+                address += 1
+        return "\n".join(lines)
+    
+    def to_dot(self):
+        lines = ["digraph cfg {", "  node [shape=box, fontname=monospace];"]
+        for start, block in sorted(self.blocks.items()):
+            body = "\\l".join(f"{pc:03X}: {mnemonic(ins)}" for pc, ins in block.instructions)
+            lines.append(f'  b{start:03X} [label="{body}\\l"];')
+            for successor in block.successors:
+                lines.append(f"  b{start:03X} -> b{successor:03X};")
+            for target in block.calls:
+                if target in self.blocks:
+                    lines.append(f"  b{start:03X} -> b{target:03X} [style=dashed];")
+        lines.append("}")
+        return "\n".join(lines)
+
+
+def analyse(memory, start=0x200, end=None, opcodes=CHIP8, entries=None):
+    if end is None:
+        # without the ROM size, take everything up to the last non-zero byte
+        end = len(memory)
+        while end > start and memory[end - 1] == 0:
+            end -= 1
+    entries = [start] if entries is None else list(entries)
+    analysis = Analysis(memory, start, end, opcodes)
+    analysis.explore(entries)
+    analysis.split_blocks(entries)
+    return analysis
+
+
+def analyse_rom(path, profile=None):
+    chip = Chip8()
+    program = chip.load_program(path)
+    profile = profile if profile is not None else quirks.profile_for_rom(path)
+    return analyse(bytes(chip.memory), chip.pc, chip.pc + len(program), profile.opcodes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="disassemble a ROM by following its control flow")
+    parser.add_argument("rom")
+    parser.add_argument("--quirks", choices=["auto"] + list(quirks.PROFILES), default="auto", help="instruction set to decode with, 'auto' looks the ROM up by hash")
+    parser.add_argument("--dot", metavar="PATH", help="write the control-flow graph to PATH in Graphviz format")
+    args = parser.parse_args()
+    
+    analysis = analyse_rom(args.rom, None if args.quirks == "auto" else quirks.PROFILES[args.quirks])
+    print(analysis.listing())
+    if args.dot:
+        with open(args.dot, "w") as f:
+            f.write(analysis.to_dot())
+
+
+if __name__ == "__main__":
+    main()
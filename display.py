@@ -1,6 +1,7 @@
 import sdl2.ext as se
 import sdl2 as s
-import pygame.mixer
+import numpy as np
+from frameBuffer import FrameBuffer
 class Display:
     def __init__(self):
         self.scale = 10
@@ -8,6 +9,11 @@ class Display:
         self.reg_width = self.width / self.scale
         self.height = 32 * self.scale
         self.reg_height = self.height / self.scale
+        # XO-CHIP draws on two bitplanes, everything else only uses the first
+        self.planes = [FrameBuffer(int(self.reg_width), int(self.reg_height)), FrameBuffer(int(self.reg_width), int(self.reg_height))]
+        self.framebuffer = self.planes[0]
+        # colour for each combination of plane bits
+        self.palette = np.array([0x00000000, 0xFFFFFFFF, 0xFFAAAAAA, 0xFF555555], dtype=np.uint32)
         
         self.running = True
         se.init()
@@ -15,10 +21,6 @@ class Display:
         self.surface = s.SDL_GetWindowSurface(self.window.window)
         self.pixels = se.pixels2d(self.surface.contents)
 
-        pygame.mixer.init()
-        self.beep_sound = pygame.mixer.Sound("beep.wav")
-        self.beep_channel = None
-
         self.window.show()
         self.KEYMAP = {
             s.SDLK_1: 0x1,
@@ -38,37 +40,45 @@ class Display:
             s.SDLK_c: 0xB,
             s.SDLK_v: 0xF,
         }
-        
-    def flip_pixel(self, x, y):
-        turned_off = False
-        # print(x,y)
-        for i in range(self.scale):
-            for j in range(self.scale):
-                if x*self.scale + i >= self.width or y*self.scale + j >= self.height:
-                    continue
-                if self.pixels[x*self.scale + i, y*self.scale + j] == 0xFFFFFFFF:         
-                    self.pixels[x*self.scale + i, y*self.scale + j] = 0x00000000
-                    turned_off = True
-                else:
-                    self.pixels[x*self.scale + i, y*self.scale + j] = 0xFFFFFFFF
-                    
-        s.SDL_UpdateWindowSurface(self.window.window)
-        # self.window.refresh()
-        # print(turned_off)
-        return turned_off
                         
     def clear(self):
-        for row in self.pixels:
-             row[:] = 0x00000000
+        self.framebuffer.clear()
+    
+    def set_resolution(self, width, height):
+        for plane in self.planes:
+            plane.resize(width, height)
+    
+    def present(self):
+        dirty = sorted(set().union(*[plane.take_dirty() for plane in self.planes]))
+        if not dirty:
+            return
+        fb = self.framebuffer
+        scale = self.width // fb.width
+        colors = self.palette[self.plane_bits(self.planes[0], dirty) | (self.plane_bits(self.planes[1], dirty) << 1)]
+        # pixels is indexed [x, y], so upscale each row into a scale x scale block column
+        block = np.repeat(np.repeat(colors.T, scale, axis=0), scale, axis=1)
+        for i, y in enumerate(dirty):
+            self.pixels[:, y*scale:(y+1)*scale] = block[:, i*scale:(i+1)*scale]
         s.SDL_UpdateWindowSurface(self.window.window)
-        # self.window.refresh()
+    
+    def plane_bits(self, plane, rows):
+        packed = b"".join(plane.rows[y].to_bytes(plane.width // 8, "big") for y in rows)
+        return np.unpackbits(np.frombuffer(packed, dtype=np.uint8)).reshape(len(rows), plane.width)
     
     def destroy(self):
         se.quit()
-        
-    def play_sound(self):
-        if self.beep_channel is None or not self.beep_channel.get_busy():
-            self.beep_channel = self.beep_sound.play()
+
+    def poll_events(self):
+        events = []
+        event = s.SDL_Event()
+        while s.SDL_PollEvent(event):
+            if event.type == s.SDL_QUIT:
+                events.append(("quit", None))
+            elif event.type == s.SDL_KEYDOWN:
+                events.append(("keydown", self.get_key(event.key.keysym.sym)))
+            elif event.type == s.SDL_KEYUP:
+                events.append(("keyup", self.get_key(event.key.keysym.sym)))
+        return events
 
     def get_key(self, k):
         if k not in self.KEYMAP:
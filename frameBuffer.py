@@ -0,0 +1,84 @@
+class FrameBuffer:
+    def __init__(self, width=64, height=32):
+        self.resize(width, height)
+    
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+        self.mask = (1 << width) - 1
+        # one int per row, the leftmost pixel is the most significant bit
+        self.rows = [0] * height
+        self.dirty = set(range(height))
+    
+    def draw_sprite(self, x, y, sprite, sprite_width=8):
+        rows = self.rows
+        shift = self.width - sprite_width - x
+        mask = self.mask
+        collision = False
+        for line in sprite:
+            if y >= self.height:
+                break
+            if shift >= 0:
+                bits = line << shift
+            else:
+                bits = (line >> -shift) & mask
+            if bits:
+                row = rows[y]
+                if row & bits:
+                    collision = True
+                rows[y] = row ^ bits
+                self.dirty.add(y)
+            y += 1
+        return collision
+    
+    def draw_sprite_wrapped(self, x, y, sprite, sprite_width=8):
+        rows = self.rows
+        width = self.width
+        shift = width - sprite_width - x
+        mask = self.mask
+        collision = False
+        for line in sprite:
+            if shift >= 0:
+                bits = line << shift
+            else:
+                # the part that falls off the right edge comes back on the left
+                bits = ((line >> -shift) | (line << (width + shift))) & mask
+            if bits:
+                row = rows[y]
+                if row & bits:
+                    collision = True
+                rows[y] = row ^ bits
+                self.dirty.add(y)
+            y = (y + 1) % self.height
+        return collision
+    
+    def clear(self):
+        self.rows = [0] * self.height
+        self.dirty.update(range(self.height))
+    
+    def scroll_down(self, n):
+        n = min(n, self.height)
+        self.rows = [0] * n + self.rows[:self.height - n]
+        self.dirty.update(range(self.height))
+    
+    def scroll_up(self, n):
+        n = min(n, self.height)
+        self.rows = self.rows[n:] + [0] * n
+        self.dirty.update(range(self.height))
+    
+    def scroll_right(self, n):
+        self.rows = [row >> n for row in self.rows]
+        self.dirty.update(range(self.height))
+    
+    def scroll_left(self, n):
+        mask = self.mask
+        self.rows = [(row << n) & mask for row in self.rows]
+        self.dirty.update(range(self.height))
+    
+    def get_pixel(self, x, y):
+        return (self.rows[y] >> (self.width - 1 - x)) & 1
+    
+    def take_dirty(self):
+        dirty = sorted(self.dirty)
+        self.dirty.clear()
+        return dirty
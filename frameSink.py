@@ -0,0 +1,243 @@
+import os
+import queue
+import struct
+import threading
+import zlib
+
+# colour for each combination of plane bits, like Display.palette
+PALETTE = [(0x00, 0x00, 0x00), (0xFF, 0xFF, 0xFF), (0xAA, 0xAA, 0xAA), (0x55, 0x55, 0x55)]
+BITS = bytes.maketrans(b"01", b"\x00\x01")
+
+
+class FrameSink:
+    # copies the framebuffer at the end of every frame and hands changed frames to a writer thread
+    def __init__(self, executor, writer, queue_size=64, block=None):
+        self.executor = executor
+        self.writer = writer
+        self.queue = queue.Queue(queue_size)
+        # a paced run must never wait on the encoder, a headless capture can wait instead of dropping
+        self.block = not executor.paced if block is None else block
+        self.last = None
+        self.dropped = 0
+        self.error = None
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+        executor.frame_listeners.append(self.capture)
+    
+    def capture(self):
+        planes = self.executor.display.planes
+        frame = (planes[0].width, planes[0].height, tuple(tuple(plane.rows) for plane in planes))
+        if frame == self.last:
+            return
+        self.last = frame
+        # frame_count has already moved past the frame that was just presented
+        item = (self.executor.frame_count - 1, frame)
+        if self.block:
+            self.queue.put(item)
+            return
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            # the next frame has to be queued even if it matches this one
+            self.last = None
+    
+    def work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                self.writer.write(*item)
+            except Exception as e:
+                self.error = e
+    
+    def close(self):
+        self.executor.frame_listeners.remove(self.capture)
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is None:
+            self.writer.close(self.executor.frame_count)
+            return
+        try:
+            # still release the writer's file, but report the error that stopped it
+            self.writer.close(self.executor.frame_count)
+        except Exception:
+            pass
+        raise self.error
+
+
+def frame_pixels(frame, scale=1):
+    # one palette index per pixel, row by row
+    width, height, planes = frame
+    lines = []
+    for y in range(height):
+        line = 0
+        for bit, plane in enumerate(planes):
+            if plane[y]:
+                # a byte per pixel, so the planes can be OR'd together
+                line |= int.from_bytes(f"{plane[y]:0{width}b}".encode().translate(BITS), "big") << bit
+        pixels = line.to_bytes(width, "big")
+        if scale > 1:
+            pixels = bytes(p for p in pixels for _ in range(scale))
+        lines.extend([pixels] * scale)
+    return lines
+
+
+class RawWriter:
+    # a header per distinct frame: first frame, frame count, width, height, planes; then the packed rows
+    RECORD = struct.Struct(">IIHHB")
+    
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.pending = None
+    
+    def write(self, index, frame):
+        self.flush(index)
+        self.pending = (index, frame)
+    
+    def flush(self, end):
+        if self.pending is None:
+            return
+        index, (width, height, planes) = self.pending
+        row_bytes = width // 8
+        self.file.write(self.RECORD.pack(index, end - index, width, height, len(planes)))
+        self.file.write(b"".join(row.to_bytes(row_bytes, "big") for rows in planes for row in rows))
+    
+    def close(self, frame_count):
+        try:
+            self.flush(frame_count)
+        finally:
+            self.file.close()
+
+
+class PngWriter:
+    # one image per distinct frame, named after the frame it first appeared on
+    def __init__(self, directory, scale=1):
+        self.directory = directory
+        self.scale = scale
+        os.makedirs(directory, exist_ok=True)
+    
+    def write(self, index, frame):
+        lines = frame_pixels(frame, self.scale)
+        width, height = len(lines[0]), len(lines)
+        raw = b"".join(b"\x00" + line for line in lines)
+        with open(os.path.join(self.directory, f"{index:06d}.png"), "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n")
+            f.write(png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)))
+            f.write(png_chunk(b"PLTE", b"".join(bytes(colour) for colour in PALETTE)))
+            f.write(png_chunk(b"IDAT", zlib.compress(raw, 6)))
+            f.write(png_chunk(b"IEND", b""))
+    
+    def close(self, frame_count):
+        pass
+
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+class GifWriter:
+    # an animated GIF, identical frames become one image with a longer delay
+    def __init__(self, path, scale=1):
+        self.file = open(path, "wb")
+        self.scale = scale
+        self.pending = None
+        self.header_written = False
+        # delay rounding error carried between frames, in 1/6000 s
+        self.carry = 0
+    
+    def write(self, index, frame):
+        self.flush(index)
+        self.pending = (index, frame)
+    
+    def flush(self, end):
+        if self.pending is None:
+            return
+        index, frame = self.pending
+        lines = frame_pixels(frame, self.scale)
+        width, height = len(lines[0]), len(lines)
+        f = self.file
+        if not self.header_written:
+            f.write(b"GIF89a" + struct.pack("<HHBBB", width, height, 0xF1, 0, 0))
+            f.write(b"".join(bytes(colour) for colour in PALETTE))
+            # loop forever
+            f.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")
+            self.header_written = True
+        # frames are 1/60 s, GIF delays are in 1/100 s
+        ticks = (end - index) * 100 + self.carry
+        delay = ticks // 60
+        self.carry = ticks % 60
+        f.write(b"\x21\xf9\x04\x04" + struct.pack("<H", delay) + b"\x00\x00")
+        f.write(b"\x2c" + struct.pack("<HHHHB", 0, 0, width, height, 0))
+        f.write(b"\x02")
+        data = lzw_encode(b"".join(lines), 2)
+        for i in range(0, len(data), 255):
+            block = data[i:i + 255]
+            f.write(bytes([len(block)]) + block)
+        f.write(b"\x00")
+    
+    def close(self, frame_count):
+        try:
+            self.flush(frame_count)
+            self.file.write(b"\x3b")
+        finally:
+            self.file.close()
+
+
+def lzw_encode(pixels, minimum_size):
+    clear = 1 << minimum_size
+    end = clear + 1
+    size = minimum_size + 1
+    table = {bytes([i]): i for i in range(clear)}
+    next_code = end + 1
+    output = bytearray()
+    buffer = 0
+    bits = 0
+
+    def emit(code):
+        nonlocal buffer, bits
+        buffer |= code << bits
+        bits += size
+        while bits >= 8:
+            output.append(buffer & 0xFF)
+            buffer >>= 8
+            bits -= 8
+
+    emit(clear)
+    prefix = b""
+    for pixel in pixels:
+        candidate = prefix + bytes([pixel])
+        if candidate in table:
+            prefix = candidate
+            continue
+        emit(table[prefix])
+        if next_code < 4096:
+            table[candidate] = next_code
+            # the decoder widens its codes one code later than the encoder adds them
+            if next_code == 1 << size and size < 12:
+                size += 1
+            next_code += 1
+        else:
+            emit(clear)
+            table = {bytes([i]): i for i in range(clear)}
+            next_code = end + 1
+            size = minimum_size + 1
+        prefix = bytes([pixel])
+    if prefix:
+        emit(table[prefix])
+    emit(end)
+    if bits:
+        output.append(buffer & 0xFF)
+    return bytes(output)
+
+
+def writer_for(path, scale=1):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".gif":
+        return GifWriter(path, scale)
+    if extension == ".raw":
+        return RawWriter(path)
+    return PngWriter(path, scale)
@@ -0,0 +1,644 @@
+import argparse
+import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+import chip8
+import headlessDisplay
+import instrucionExecutor
+import quirks
+from batchChip8 import BatchChip8
+from disassembler import mnemonic
+from instruction import CHIP8, SCHIP, XOCHIP, decode
+
+# every engine is checked against Reference, a separate interpreter that never skips or compiles anything
+ENGINES = ["table", "idle", "jit", "batch"]
+# where Chip8 loads the small and big fonts
+FONT_ADDRESS = 0x50
+BIG_FONT_ADDRESS = 0xA0
+
+# opcode shapes the generator picks from, X, Y and N are filled with random nibbles
+TEMPLATES = {
+    CHIP8: ["00E0", "00EE", "1NNN", "2NNN", "3XNN", "4XNN", "5XY0", "6XNN", "7XNN",
+            "8XY0", "8XY1", "8XY2", "8XY3", "8XY4", "8XY5", "8XY6", "8XY7", "8XYE",
+            "9XY0", "ANNN", "BNNN", "CXNN", "DXYN", "EX9E", "EXA1",
+            "FX07", "FX0A", "FX15", "FX18", "FX1E", "FX29", "FX33", "FX55", "FX65"],
+    SCHIP: ["00CN", "00FB", "00FC", "00FD", "00FE", "00FF", "DXY0", "FX30", "FX75", "FX85"],
+    XOCHIP: ["00DN", "5XY2", "5XY3", "F000", "FN01", "F002", "FX3A"],
+}
+# share of words that are completely random, for decoding edge cases and unknown opcodes
+RAW_WORDS = 0.05
+# share of NNN operands kept inside the generated program, so control flow stays in code
+LOCAL_TARGETS = 0.9
+# chance of a key being tapped on any frame
+KEY_TAPS = 0.3
+
+# compared in this order, so the report names the most telling difference
+FIELDS = ("error", "pc", "index_register", "registers", "stack", "delay_timer", "sound_timer",
+          "waiting_register", "flags", "plane_mask", "memory", "display")
+
+
+def templates_for(opcodes):
+    templates = list(TEMPLATES[CHIP8])
+    if opcodes in (SCHIP, XOCHIP):
+        templates += TEMPLATES[SCHIP]
+    if opcodes == XOCHIP:
+        templates += TEMPLATES[XOCHIP]
+    return templates
+
+
+def random_opcode(rng, templates, start, end):
+    if rng.random() < RAW_WORDS:
+        return rng.getrandbits(16)
+    template = rng.choice(templates)
+    opcode = 0
+    for c in template:
+        opcode = (opcode << 4) | (rng.randrange(16) if c in "XYN" else int(c, 16))
+    if template.endswith("NNN") and rng.random() < LOCAL_TARGETS:
+        opcode = (opcode & 0xF000) | rng.randrange(start, end, 2)
+    return opcode
+
+
+class Case:
+    # a program and starting machine state, rebuilt from the seed wherever it is needed
+    def __init__(self, seed, profile, length=128, frames=30, instructions_per_frame=100):
+        rng = random.Random(seed)
+        self.seed = seed
+        self.profile = profile
+        self.frames = frames
+        self.instructions_per_frame = instructions_per_frame
+        start = 0x200
+        end = start + 2 * length
+        templates = templates_for(profile.opcodes)
+        program = b"".join(random_opcode(rng, templates, start, end).to_bytes(2, "big") for _ in range(length))
+        # random data after the program, so stray jumps land somewhere other than a run of 0000s
+        self.program = program + rng.randbytes(max(0, chip8.MEMORY_SIZE - end))
+        self.registers = bytes(rng.getrandbits(8) for _ in range(16))
+        self.index_register = rng.randrange(0x1000)
+        self.delay_timer = rng.choice((0, rng.randrange(256)))
+        self.sound_timer = rng.choice((0, rng.randrange(256)))
+        self.keys = rng.choice((0, rng.getrandbits(16)))
+        # frame -> key events delivered before it starts, taps are released a frame later so FX0A can finish
+        self.events = {}
+        for frame in range(frames):
+            if rng.random() < KEY_TAPS:
+                key = rng.randrange(16)
+                self.events.setdefault(frame, []).append(("keydown", key))
+                self.events.setdefault(frame + 1, []).append(("keyup", key))
+    
+    def executor(self, engine):
+        chip = chip8.Chip8()
+        chip.memory[0x200:0x200 + len(self.program)] = self.program
+        chip.registers[:] = self.registers
+        chip.index_register = self.index_register
+        chip.delay_timer = self.delay_timer
+        chip.sound_timer = self.sound_timer
+        display = headlessDisplay.HeadlessDisplay()
+        executor = instrucionExecutor.InstructionExecutor(chip, display, paced=False, seed=self.seed,
+                                                          skip_idle_loops=engine in ("idle", "jit"), quirks=self.profile)
+        executor.instructions_per_frame = self.instructions_per_frame
+        executor.keypad.state = self.keys
+        if engine == "jit":
+            executor.enable_block_compiler()
+        return executor
+
+
+class Reference:
+    # a plain interpreter written straight from the opcode table, sharing no code with the engines it checks
+    def __init__(self, case):
+        quirks = case.profile
+        self.quirks = quirks
+        self.extended = quirks.opcodes != CHIP8
+        self.xochip = quirks.opcodes == XOCHIP
+        self.instructions_per_frame = case.instructions_per_frame
+        # only the font comes from Chip8, everything else is set up here
+        self.memory = bytearray(chip8.Chip8().memory)
+        self.memory[0x200:0x200 + len(case.program)] = case.program
+        self.registers = bytearray(case.registers)
+        self.stack = []
+        self.pc = 0x200
+        self.index_register = case.index_register
+        self.delay_timer = case.delay_timer
+        self.sound_timer = case.sound_timer
+        self.keys = case.keys
+        self.released = None
+        self.waiting_register = None
+        self.flags = bytearray(16)
+        self.plane_mask = 1
+        self.width = 64
+        self.height = 32
+        self.planes = [[0] * 32, [0] * 32]
+        self.exited = False
+        self.random = random.Random(case.seed)
+        # (pc, opcode) for everything run this frame
+        self.trace = []
+        # set once CXNN draws a value the batch engine can't reproduce
+        self.drew_random = False
+    
+    def step_frame(self, events):
+        for event, key in events:
+            if event == "keydown":
+                self.keys |= 1 << key
+            elif self.keys & (1 << key):
+                self.keys &= ~(1 << key)
+                self.released = key
+        if self.waiting_register is not None and self.released is not None:
+            self.registers[self.waiting_register] = self.released
+            self.pc += 2
+            self.waiting_register = None
+        
+        if self.waiting_register is None:
+            for _ in range(self.instructions_per_frame):
+                self.step()
+                # FX0A ends the frame as soon as it starts waiting
+                if self.waiting_register is not None:
+                    break
+        if self.exited:
+            return False
+        self.delay_timer = max(0, self.delay_timer - 1)
+        self.sound_timer = max(0, self.sound_timer - 1)
+        return True
+    
+    def step(self):
+        memory = self.memory
+        v = self.registers
+        pc = self.pc
+        opcode = (memory[pc] << 8) | memory[pc + 1]
+        self.trace.append((pc, opcode))
+        self.pc = pc + 2
+        x = (opcode >> 8) & 0xF
+        y = (opcode >> 4) & 0xF
+        n = opcode & 0xF
+        nn = opcode & 0xFF
+        nnn = opcode & 0xFFF
+        
+        match opcode >> 12:
+            case 0x0 if self.extended:
+                match opcode:
+                    case 0x00E0:
+                        self.clear()
+                    case 0x00EE:
+                        self.ret()
+                    case 0x00FB:
+                        self.scroll(lambda rows: [row >> 4 for row in rows])
+                    case 0x00FC:
+                        self.scroll(lambda rows: [(row << 4) & ((1 << self.width) - 1) for row in rows])
+                    case 0x00FD:
+                        self.exited = True
+                        self.pc -= 2
+                    case 0x00FE:
+                        self.resize(64, 32)
+                    case 0x00FF:
+                        self.resize(128, 64)
+                    case _ if opcode & 0xFFF0 == 0x00C0:
+                        self.scroll(lambda rows: [rows[r - n] if r >= n else 0 for r in range(len(rows))])
+                    case _ if opcode & 0xFFF0 == 0x00D0 and self.xochip:
+                        self.scroll(lambda rows: [rows[r + n] if r + n < len(rows) else 0 for r in range(len(rows))])
+            case 0x0:
+                # the CHIP-8 decoder only looks at the last nibble of 0NNN
+                if n == 0x0:
+                    self.clear()
+                elif n == 0xE:
+                    self.ret()
+            case 0x1:
+                self.pc = nnn
+            case 0x2:
+                if len(self.stack) == 16:
+                    raise IndexError(f"stack overflow calling {nnn:#05x}")
+                self.stack.append(self.pc)
+                self.pc = nnn
+            case 0x3:
+                if v[x] == nn:
+                    self.skip()
+            case 0x4:
+                if v[x] != nn:
+                    self.skip()
+            case 0x5 if self.xochip:
+                match n:
+                    case 0x0:
+                        if v[x] == v[y]:
+                            self.skip()
+                    case 0x2:
+                        for i, r in enumerate(self.register_range(x, y)):
+                            memory[self.index_register + i] = v[r]
+                    case 0x3:
+                        for i, r in enumerate(self.register_range(x, y)):
+                            v[r] = memory[self.index_register + i]
+            case 0x5:
+                if v[x] == v[y]:
+                    self.skip()
+            case 0x6:
+                v[x] = nn
+            case 0x7:
+                v[x] = (v[x] + nn) % 256
+            case 0x8:
+                vx = v[x]
+                vy = v[y]
+                source = vy if self.quirks.shift_uses_vy else vx
+                # VF is written before VX, so 8FYN keeps the result rather than the flag
+                match n:
+                    case 0x0:
+                        v[x] = vy
+                    case 0x1 | 0x2 | 0x3:
+                        v[x] = (vx | vy, vx & vy, vx ^ vy)[n - 1]
+                        if self.quirks.logic_resets_vf:
+                            v[0xF] = 0
+                    case 0x4:
+                        v[0xF] = 1 if vx + vy > 255 else 0
+                        v[x] = (vx + vy) % 256
+                    case 0x5:
+                        v[0xF] = 1 if vx >= vy else 0
+                        v[x] = (vx - vy) % 256
+                    case 0x6:
+                        v[0xF] = source % 2
+                        v[x] = source // 2
+                    case 0x7:
+                        v[0xF] = 1 if vy >= vx else 0
+                        v[x] = (vy - vx) % 256
+                    case 0xE:
+                        v[0xF] = source // 128
+                        v[x] = (source * 2) % 256
+            case 0x9:
+                if v[x] != v[y]:
+                    self.skip()
+            case 0xA:
+                self.index_register = nnn
+            case 0xB:
+                self.pc = nnn + v[x if self.quirks.jump_uses_vx else 0]
+            case 0xC:
+                v[x] = self.random.randrange(256) & nn
+                if nn:
+                    self.drew_random = True
+            case 0xD if n == 0 and self.extended:
+                self.draw(v[x], v[y], 16, 16)
+            case 0xD:
+                self.draw(v[x], v[y], 8, n)
+            case 0xE if nn in (0x9E, 0xA1):
+                held = v[x] < 16 and self.keys & (1 << v[x]) != 0
+                if held == (nn == 0x9E):
+                    self.skip()
+            case 0xF:
+                ir = self.index_register
+                increment = x + 1 if self.quirks.load_store_increments_i else 0
+                match nn:
+                    case 0x30 if self.extended:
+                        self.index_register = (v[x] & 0xF) * 10 + BIG_FONT_ADDRESS
+                    case 0x75 if self.extended:
+                        self.flags[:x + 1] = v[:x + 1]
+                    case 0x85 if self.extended:
+                        v[:x + 1] = self.flags[:x + 1]
+                    case 0x00 if self.xochip and x == 0:
+                        self.index_register = (memory[self.pc] << 8) | memory[self.pc + 1]
+                        self.pc += 2
+                    case 0x01 if self.xochip:
+                        self.plane_mask = x & 0x3
+                    case 0x02 if self.xochip and x == 0:
+                        # audio pattern and pitch, nothing the comparison sees
+                        pass
+                    case 0x3A if self.xochip:
+                        pass
+                    case 0x07:
+                        v[x] = self.delay_timer
+                    case 0x0A:
+                        self.waiting_register = x
+                        self.released = None
+                        self.pc -= 2
+                    case 0x15:
+                        self.delay_timer = v[x]
+                    case 0x18:
+                        self.sound_timer = v[x]
+                    case 0x1E:
+                        total = ir + v[x]
+                        v[0xF] = 1 if total > 0xFFF else 0
+                        self.index_register = total & 0xFFF
+                    case 0x29:
+                        self.index_register = (v[x] & 0xF) * 5 + FONT_ADDRESS
+                    case 0x33:
+                        for i, digit in enumerate((v[x] // 100, v[x] // 10 % 10, v[x] % 10)):
+                            memory[ir + i] = digit
+                    case 0x55:
+                        for i in range(x + 1):
+                            memory[ir + i] = v[i]
+                        self.index_register = ir + increment
+                    case 0x65:
+                        for i in range(x + 1):
+                            v[i] = memory[ir + i]
+                        self.index_register = ir + increment
+    
+    def skip(self):
+        # XO-CHIP skips F000 NNNN as a whole
+        pc = self.pc
+        self.pc = pc + 2
+        if self.xochip and self.memory[pc] == 0xF0 and self.memory[pc + 1] == 0x00:
+            self.pc = pc + 4
+    
+    def ret(self):
+        if self.stack:
+            self.pc = self.stack.pop()
+    
+    def register_range(self, x, y):
+        return range(x, y + 1) if x <= y else range(x, y - 1, -1)
+    
+    def active_planes(self):
+        return [p for p in range(2) if self.plane_mask & (1 << p)]
+    
+    def clear(self):
+        for p in self.active_planes():
+            self.planes[p] = [0] * self.height
+    
+    def scroll(self, move):
+        for p in self.active_planes():
+            self.planes[p] = move(self.planes[p])
+    
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+        self.planes = [[0] * height, [0] * height]
+    
+    def draw(self, vx, vy, sprite_width, sprite_height):
+        # pixel by pixel, each active plane reads the sprite that follows the previous plane's
+        bytes_per_row = sprite_width // 8
+        address = self.index_register
+        collision = False
+        for p in self.active_planes():
+            rows = self.planes[p]
+            for r in range(sprite_height):
+                start = address + r * bytes_per_row
+                if start + bytes_per_row > len(self.memory):
+                    break
+                line = int.from_bytes(self.memory[start:start + bytes_per_row], "big")
+                for c in range(sprite_width):
+                    if not line >> (sprite_width - 1 - c) & 1:
+                        continue
+                    px = vx % self.width + c
+                    py = vy % self.height + r
+                    if self.quirks.sprite_wrap:
+                        px %= self.width
+                        py %= self.height
+                    elif px >= self.width or py >= self.height:
+                        continue
+                    bit = 1 << (self.width - 1 - px)
+                    if rows[py] & bit:
+                        collision = True
+                    rows[py] ^= bit
+            address += sprite_height * bytes_per_row
+        self.registers[0xF] = 1 if collision else 0
+    
+    def snapshot(self, error):
+        return {
+            "error": error,
+            "pc": self.pc,
+            "index_register": self.index_register,
+            "registers": bytes(self.registers),
+            "stack": list(self.stack),
+            "delay_timer": self.delay_timer,
+            "sound_timer": self.sound_timer,
+            "waiting_register": self.waiting_register,
+            "flags": bytes(self.flags),
+            "plane_mask": self.plane_mask,
+            "memory": bytes(self.memory),
+            "display": (self.width, self.height, tuple(tuple(rows) for rows in self.planes)),
+        }
+
+
+def snapshot(executor, error):
+    chip = executor.chip8
+    planes = executor.display.planes
+    return {
+        "error": error,
+        "pc": chip.pc,
+        "index_register": chip.index_register,
+        "registers": bytes(chip.registers),
+        "stack": chip.stack[:chip.sp].tolist(),
+        "delay_timer": chip.delay_timer,
+        "sound_timer": chip.sound_timer,
+        "waiting_register": executor.waiting_register,
+        "flags": bytes(executor.flags),
+        "plane_mask": executor.plane_mask,
+        "memory": bytes(chip.memory),
+        "display": (planes[0].width, planes[0].height, tuple(tuple(plane.rows) for plane in planes)),
+    }
+
+
+def batch_snapshot(batch, i):
+    chip = batch.get_chip8(i)
+    rows = tuple(batch.get_framebuffer(i).rows)
+    waiting = int(batch.waiting[i])
+    return {
+        "error": None,
+        "pc": chip.pc,
+        "index_register": chip.index_register,
+        "registers": bytes(chip.registers),
+        "stack": chip.stack[:chip.sp].tolist(),
+        "delay_timer": chip.delay_timer,
+        "sound_timer": chip.sound_timer,
+        "waiting_register": waiting if waiting >= 0 else None,
+        "flags": bytes(16),
+        "plane_mask": 1,
+        "memory": bytes(chip.memory),
+        "display": (len(rows) * 2, len(rows), (rows, (0,) * len(rows))),
+    }
+
+
+def first_difference(expected, actual):
+    for field in FIELDS:
+        a = expected[field]
+        b = actual[field]
+        if a == b:
+            continue
+        match field:
+            case "registers" | "flags":
+                r = next(r for r in range(len(a)) if a[r] != b[r])
+                return f"{field} V{r:X}: expected {a[r]:#04x}, got {b[r]:#04x}"
+            case "memory":
+                address = next(address for address in range(len(a)) if a[address] != b[address])
+                return f"memory[{address:#05x}]: expected {a[address]:#04x}, got {b[address]:#04x}"
+            case "display" if a[:2] == b[:2]:
+                plane, y = next((p, y) for p in range(len(a[2])) for y in range(a[1]) if a[2][p][y] != b[2][p][y])
+                return f"display plane {plane} row {y}: expected {a[2][plane][y]:0{a[0] // 4}x}, got {b[2][plane][y]:0{a[0] // 4}x}"
+            case "display":
+                return f"display resolution: expected {a[0]}x{a[1]}, got {b[0]}x{b[1]}"
+            case _:
+                return f"{field}: expected {a!r}, got {b!r}"
+    return None
+
+
+class Divergence:
+    def __init__(self, case, engine, frame, difference, trace):
+        self.case = case
+        self.engine = engine
+        self.frame = frame
+        self.difference = difference
+        # (pc, opcode) for everything the reference ran in the diverging frame
+        self.trace = trace
+    
+    def report(self, limit=32):
+        lines = [f"seed {self.case.seed} ({self.case.profile.name}): {self.engine} diverged in frame {self.frame}, {self.difference}"]
+        # a waiting FX0A or a tight loop repeats the same instruction, show it once with a count
+        runs = []
+        for entry in self.trace:
+            if runs and runs[-1][0] == entry:
+                runs[-1][1] += 1
+            else:
+                runs.append([entry, 1])
+        if len(runs) > limit:
+            lines.append(f"  ... {sum(count for _, count in runs[:-limit])} earlier instructions this frame")
+        for (pc, opcode), count in runs[-limit:]:
+            repeat = f"  x{count}" if count > 1 else ""
+            lines.append(f"  {pc:03X}: {opcode:04X}  {mnemonic(decode(opcode, self.case.profile.opcodes))}{repeat}")
+        return "\n".join(lines)
+
+
+def run_batch(cases):
+    # every case in one batch, a snapshot per frame until the machine faults
+    first = cases[0]
+    batch = BatchChip8(len(cases), first.instructions_per_frame, first.profile, seed=first.seed)
+    for i, case in enumerate(cases):
+        batch.memory[i, 0x200:0x200 + len(case.program)] = np.frombuffer(case.program, dtype=np.uint8)
+        batch.registers[i] = np.frombuffer(case.registers, dtype=np.uint8)
+        batch.index_register[i] = case.index_register
+        batch.delay_timer[i] = case.delay_timer
+        batch.sound_timer[i] = case.sound_timer
+        batch.keys[i] = case.keys
+    snapshots = [[] for _ in cases]
+    for frame in range(first.frames):
+        for i, case in enumerate(cases):
+            for event, key in case.events.get(frame, ()):
+                if event == "keydown":
+                    batch.press([i], key)
+                else:
+                    batch.release([i], key)
+        was_faulted = batch.faulted.copy()
+        batch.step_frame()
+        for i in np.flatnonzero(~was_faulted):
+            snapshots[i].append("fault" if batch.faulted[i] else batch_snapshot(batch, i))
+    return snapshots
+
+
+def run_case(case, engines, batch_snapshots=None):
+    # steps every engine a frame at a time and returns (instructions run, first Divergence or None)
+    reference = Reference(case)
+    machines = {engine: case.executor(engine) for engine in engines if engine != "batch"}
+    instructions = 0
+    for frame in range(case.frames):
+        events = case.events.get(frame, ())
+        reference.trace = []
+        try:
+            running = reference.step_frame(events)
+            error = None
+        except Exception as e:
+            running = False
+            error = type(e).__name__
+        expected = reference.snapshot(error)
+        instructions += len(reference.trace)
+        
+        for engine, executor in machines.items():
+            executor.display.events.extend(events)
+            try:
+                engine_running = executor.step_frame()
+                error = None
+            except Exception as e:
+                engine_running = False
+                error = type(e).__name__
+            actual = snapshot(executor, error)
+            difference = first_difference(expected, actual)
+            if difference is None and engine_running != running:
+                difference = f"expected the machine to {'keep running' if running else 'stop'}"
+            if difference is not None:
+                return instructions, Divergence(case, engine, frame, difference, reference.trace)
+        
+        # the batch engine draws random numbers from its own generator
+        if batch_snapshots is not None and frame < len(batch_snapshots) and not reference.drew_random:
+            actual = batch_snapshots[frame]
+            if actual == "fault" or expected["error"] is not None:
+                if actual != "fault":
+                    return instructions, Divergence(case, "batch", frame, f"expected {expected['error']}, got no fault", reference.trace)
+                if expected["error"] is None:
+                    return instructions, Divergence(case, "batch", frame, "expected no error, got a fault", reference.trace)
+                batch_snapshots = None
+            else:
+                difference = first_difference(expected, actual)
+                if difference is not None:
+                    return instructions, Divergence(case, "batch", frame, difference, reference.trace)
+        if not running:
+            break
+    return instructions, None
+
+
+def run_job(job):
+    first_seed, count, profile_name, length, frames, instructions_per_frame, engines = job
+    profile = quirks.PROFILES[profile_name]
+    cases = [Case(seed, profile, length, frames, instructions_per_frame) for seed in range(first_seed, first_seed + count)]
+    
+    # unknown opcodes print from the interpreter
+    sys.stdout = open(os.devnull, "w")
+    try:
+        batch = run_batch(cases) if "batch" in engines and profile.opcodes == CHIP8 else None
+        instructions = 0
+        divergences = []
+        for i, case in enumerate(cases):
+            executed, divergence = run_case(case, engines, batch[i] if batch is not None else None)
+            instructions += executed
+            if divergence is not None:
+                divergences.append((divergence.engine, divergence.case.seed, divergence.report()))
+    finally:
+        sys.stdout.close()
+        sys.stdout = sys.__stdout__
+    return profile_name, count, instructions, divergences
+
+
+def make_jobs(seed, cases, profiles, chunk, length, frames, instructions_per_frame, engines):
+    jobs = []
+    for profile in profiles:
+        for first in range(seed, seed + cases, chunk):
+            jobs.append((first, min(chunk, seed + cases - first), profile, length, frames, instructions_per_frame, engines))
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run random programs on every engine side by side and report where they first disagree")
+    parser.add_argument("--cases", type=int, default=2000, help="programs per quirks profile")
+    parser.add_argument("--seed", type=int, default=None, help="first case seed, random by default")
+    parser.add_argument("--profiles", nargs="+", default=list(quirks.PROFILES), choices=list(quirks.PROFILES))
+    parser.add_argument("--engines", nargs="+", default=ENGINES, choices=ENGINES, help="engines to compare with the reference interpreter")
+    parser.add_argument("--length", type=int, default=128, help="instructions per generated program")
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--ipf", type=int, default=100, help="instructions per frame")
+    parser.add_argument("--chunk", type=int, default=128, help="cases per job, the batch engine runs a job at once")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--show", type=int, default=5, help="divergences to print in full")
+    args = parser.parse_args()
+    
+    seed = args.seed if args.seed is not None else random.randrange(1 << 32)
+    jobs = make_jobs(seed, args.cases, args.profiles, args.chunk, args.length, args.frames, args.ipf, args.engines)
+    print(f"{args.cases} cases per profile from seed {seed}", flush=True)
+    start = time.perf_counter()
+    totals = {profile: [0, 0, []] for profile in args.profiles}
+    with Pool(args.processes) as pool:
+        for profile, count, instructions, divergences in pool.imap_unordered(run_job, jobs):
+            total = totals[profile]
+            total[0] += count
+            total[1] += instructions
+            total[2] += divergences
+    elapsed = time.perf_counter() - start
+    
+    instructions = sum(total[1] for total in totals.values())
+    print(f"{instructions} instructions on {len(args.engines) + 1} engines in {elapsed:.2f}s ({instructions / elapsed * 60 / 1e6:.2f}M per minute)")
+    failures = []
+    for profile, (count, executed, divergences) in totals.items():
+        by_engine = ", ".join(f"{engine} {sum(1 for d in divergences if d[0] == engine)}" for engine in args.engines)
+        print(f"{profile:<8} {count} cases, {executed} instructions, {len(divergences)} diverged ({by_engine})")
+        failures += divergences
+    # the lowest seeds first, so reruns with the same --seed report the same cases
+    failures.sort(key=lambda divergence: divergence[1])
+    for _, _, report in failures[:args.show]:
+        print(report)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
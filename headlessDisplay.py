@@ -0,0 +1,42 @@
+from collections import deque
+from frameBuffer import FrameBuffer
+
+class HeadlessDisplay:
+    def __init__(self):
+        self.reg_width = 64
+        self.reg_height = 32
+        self.running = True
+        # XO-CHIP draws on two bitplanes, everything else only uses the first
+        self.planes = [FrameBuffer(self.reg_width, self.reg_height), FrameBuffer(self.reg_width, self.reg_height)]
+        self.framebuffer = self.planes[0]
+        self.events = deque()
+    
+    
+    def clear(self):
+        self.framebuffer.clear()
+    
+    def set_resolution(self, width, height):
+        for plane in self.planes:
+            plane.resize(width, height)
+    
+    def present(self):
+        for plane in self.planes:
+            plane.take_dirty()
+    
+    def destroy(self):
+        self.running = False
+    
+    
+    def press_key(self, key):
+        self.events.append(("keydown", key))
+    
+    def release_key(self, key):
+        self.events.append(("keyup", key))
+    
+    def quit(self):
+        self.events.append(("quit", None))
+    
+    def poll_events(self):
+        events = list(self.events)
+        self.events.clear()
+        return events
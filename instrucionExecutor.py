@@ -1,441 +1,706 @@
-from chip8 import Chip8
-from instruction import Instruction, InstructionType
-from display import Display
-import sdl2
+from chip8 import Chip8, STACK_DEPTH
+from keypad import Keypad
+from quirks import Quirks
+from nullAudio import NullAudio
+from instruction import Instruction, InstructionType, XOCHIP, decode
+from functools import partial
 import random
 import time
 
+FRAME_RATE = 60
+# square wave the sound timer plays until an XO-CHIP ROM loads its own pattern
+DEFAULT_PATTERN = bytes([0x00, 0xFF] * 8)
+DEFAULT_PITCH = 64
+
+# instructions that leave memory, the display, timers and the stack alone, so a
+# loop made only of these can't change anything once its registers stop changing
+IDLE_LOOP_TYPES = {
+    InstructionType.SET_REGISTER,
+    InstructionType.ADD_REGISTER,
+    InstructionType.SET_INDEX_REGISTER,
+    InstructionType.JUMP_EQ_NN,
+    InstructionType.JUMP_NEQ_NN,
+    InstructionType.JUMP_EQ,
+    InstructionType.JUMP_NEQ,
+    InstructionType.COPY,
+    InstructionType.BINARY_OR,
+    InstructionType.BINARY_AND,
+    InstructionType.LOGICAL_XOR,
+    InstructionType.ADD,
+    InstructionType.SUBTRACT,
+    InstructionType.ISUBTRACT,
+    InstructionType.RSHIFT,
+    InstructionType.LSHIFT,
+    InstructionType.ADD_INDEX,
+    InstructionType.SKIP_IF_KEY,
+    InstructionType.SKIP_IF_NOT_KEY,
+    InstructionType.FONT,
+    InstructionType.LOAD,
+    InstructionType.READ_DELAY_TIMER,
+}
+
+
+class IdleLoop(Exception):
+    pass
+
+
+class WaitForKey(Exception):
+    # FX0A parked the CPU, nothing else runs until a key is released
+    pass
+
+
 class InstructionExecutor:
-    def __init__(self, chip8: Chip8, display: Display):
+    def __init__(self, chip8: Chip8, display: "Display", instructions_per_second=700, paced=True, seed=None, skip_idle_loops=True, quirks: Quirks = None, audio=None):
         self.chip8 : Chip8 = chip8
-        self.display : Display = display
-        self.current_instruction : Instruction = None
-        self.is_key_pressed = False
-        self.key = None
-        self.delay_timer_interval = 0
-        self.sound_timer_interval = 0
-        self.clear_key = time.perf_counter()
-    
-    def fetch(self):
-        byte1 = self.chip8.memory[self.chip8.pc]
-        byte2 = self.chip8.memory[self.chip8.pc + 1]
-        # print("byte1:"  + str(byte1), "byte 2:" + str(byte2))
-        
-        self.chip8.pc += 2
-        self.current_instruction = Instruction(byte1, byte2)
-        
+        # display.Display or headlessDisplay.HeadlessDisplay, the core never imports a frontend
+        self.display : "Display" = display
+        self.keypad = Keypad()
+        # register FX0A is waiting to fill, None while the CPU is running
+        self.waiting_register = None
+        self.instructions_per_frame = max(1, round(instructions_per_second / FRAME_RATE))
+        self.paced = paced
+        self.frame_count = 0
+        self.seed = seed if seed is not None else random.randrange(1 << 64)
+        self.random = random.Random(self.seed)
+        # events polled at the start of the current frame
+        self.frame_events = []
+        self.block_compiler = None
+        self.skip_idle_loops = skip_idle_loops
+        self.quirks : Quirks = quirks if quirks is not None else Quirks()
+        # (loop start, jump address) -> whether the loop body can idle
+        self.idle_loop_bodies = {}
+        # (loop start, jump address, registers, index register) at the last backward jump
+        self.last_loop_state = None
+        self.idle_instructions = 0
+        # instructions actually executed, not counting skipped idle loop iterations
+        self.instructions_run = 0
+        # SUPER-CHIP/XO-CHIP state
+        self.flags = bytearray(16)
+        self.plane_mask = 1
+        self.active_planes = [display.planes[0]]
+        self.exited = False
+        self.audio = audio if audio is not None else NullAudio()
+        self.audio_pattern = DEFAULT_PATTERN
+        self.pitch = DEFAULT_PITCH
+        self.audio.set_tone(self.audio_pattern, self.pitch)
+        # whether the tone is playing, so the backend only hears about timer edges
+        self.sound_on = False
+        # called with no arguments at the end of every frame
+        self.frame_listeners = []
+        # indexed by the 16-bit opcode, filled lazily with prebound handlers
+        self.decode_table = [None] * 0x10000
     
-    def dispatch(self):
-        self.current_instruction.t = InstructionType.UNKNOWN
-        match self.current_instruction.upper_b1:
-            case 0x0:
-                if self.current_instruction.lower_b2 == 0x0:
-                    self.current_instruction.t = InstructionType.CLEAR
-                
-                elif self.current_instruction.lower_b2 == 0xE:
-                    self.current_instruction.t = InstructionType.RETURN
-            case 0x2:
-                self.current_instruction.t = InstructionType.CALL
-            case 0x1:
-                self.current_instruction.t = InstructionType.JUMP
-            case 0x3:
-                self.current_instruction.t = InstructionType.JUMP_EQ_NN
-            case 0x4:
-                self.current_instruction.t = InstructionType.JUMP_NEQ_NN
-            case 0x5:
-                self.current_instruction.t = InstructionType.JUMP_EQ
-            case 0x6:
-                self.current_instruction.t = InstructionType.SET_REGISTER
-            case 0x7:
-                self.current_instruction.t = InstructionType.ADD_REGISTER
-            case 0x8:
-                if self.current_instruction.lower_b2 == 0x0:
-                    self.current_instruction.t = InstructionType.COPY
-                elif self.current_instruction.lower_b2 == 0x1:
-                    self.current_instruction.t = InstructionType.BINARY_OR
-                elif self.current_instruction.lower_b2 == 0x2:
-                    self.current_instruction.t = InstructionType.BINARY_AND
-                if self.current_instruction.lower_b2 == 0x3:
-                    self.current_instruction.t = InstructionType.LOGICAL_XOR
-                if self.current_instruction.lower_b2 == 0x4:
-                    self.current_instruction.t = InstructionType.ADD
-                if self.current_instruction.lower_b2 == 0x5:
-                    self.current_instruction.t = InstructionType.SUBTRACT    
-                if self.current_instruction.lower_b2 == 0x7:
-                    self.current_instruction.t = InstructionType.ISUBTRACT
-                if self.current_instruction.lower_b2 == 0x6:
-                    self.current_instruction.t = InstructionType.RSHIFT 
-                if self.current_instruction.lower_b2 == 0x9:
-                    self.current_instruction.t = InstructionType.LSHIFT
-            case 0x9:
-                self.current_instruction.t = InstructionType.JUMP_NEQ
-            case 0xA:
-                self.current_instruction.t = InstructionType.SET_INDEX_REGISTER
-            case 0xB:
-                self.current_instruction.t = InstructionType.JUMP_OFFSET
-            case 0xD:
-                self.current_instruction.t = InstructionType.DISPLAY
-            case 0xE:
-                if self.current_instruction.upper_b2 == 0x9 and self.current_instruction.lower_b2 == 0xE:
-                    self.current_instruction.t = InstructionType.SKIP_IF_KEY
-                elif self.current_instruction.upper_b2 == 0xA and self.current_instruction.lower_b2 == 0x1:
-                    self.current_instruction.t = InstructionType.SKIP_IF_NOT_KEY
-            case 0xF:
-                if self.current_instruction.upper_b2 == 0x1 and self.current_instruction.lower_b2 == 0xE:
-                    self.current_instruction.t = InstructionType.ADD_INDEX
-                elif self.current_instruction.upper_b2 == 0x0 and self.current_instruction.lower_b2 == 0xA:
-                    self.current_instruction.t = InstructionType.GET_KEY
-                elif self.current_instruction.upper_b2 == 0x2 and self.current_instruction.lower_b2 == 0x9:
-                    self.current_instruction.t = InstructionType.FONT
-                elif self.current_instruction.upper_b2 == 0x3 and self.current_instruction.lower_b2 == 0x3:
-                    self.current_instruction.t = InstructionType.BINARY_CODED_DECIMAL
-                elif self.current_instruction.upper_b2 == 0x5 and self.current_instruction.lower_b2 == 0x5:
-                    self.current_instruction.t = InstructionType.STORE
-                elif self.current_instruction.upper_b2 == 0x6 and self.current_instruction.lower_b2 == 0x5:
-                    self.current_instruction.t = InstructionType.LOAD
-                elif self.current_instruction.upper_b2 == 0x0 and self.current_instruction.lower_b2 == 0x7:
-                    self.current_instruction.t = InstructionType.READ_DELAY_TIMER
-                elif self.current_instruction.upper_b2 == 0x1 and self.current_instruction.lower_b2 == 0x5:
-                    self.current_instruction.t = InstructionType.SET_DELAY_TIMER
-                elif self.current_instruction.upper_b2 == 0x1 and self.current_instruction.lower_b2 == 0x8:
-                    self.current_instruction.t = InstructionType.SET_BEAP_TIMER
-            case _:
-                self.current_instruction.t = InstructionType.UNKNOWN
-    
-    def execute(self):
-        match self.current_instruction.t:
+    def decode(self, opcode):
+        ins : Instruction = decode(opcode, self.quirks.opcodes)
+        xochip = self.quirks.opcodes == XOCHIP
+        x = ins.lower_b1
+        y = ins.upper_b2
+        n = ins.lower_b2
+        nn = ins.b2
+        nnn = ins.nnn
+        match ins.t:
             case InstructionType.JUMP:
-                self.execute_jump()
-            
+                if self.skip_idle_loops:
+                    handler = partial(self.execute_jump_detect_idle, nnn)
+                else:
+                    handler = partial(self.execute_jump, nnn)
             case InstructionType.SET_REGISTER:
-                self.execute_set_register()    
-            
+                handler = partial(self.execute_set_register, x, nn)
             case InstructionType.ADD_REGISTER:
-                self.execute_add_register()    
-                
+                handler = partial(self.execute_add_register, x, nn)
             case InstructionType.SET_INDEX_REGISTER:
-                self.execute_set_index_register()    
-                
+                handler = partial(self.execute_set_index_register, nnn)
             case InstructionType.CLEAR:
-                self.execute_clear()
-
+                handler = self.execute_clear
             case InstructionType.DISPLAY:
-                self.execute_display()
-            
+                if self.quirks.sprite_wrap:
+                    handler = partial(self.execute_display_wrapped, x, y, n)
+                else:
+                    handler = partial(self.execute_display, x, y, n)
             case InstructionType.RETURN:
-                self.execute_return()
-                
+                handler = self.execute_return
             case InstructionType.CALL:
-                self.execute_call()
-                
+                handler = partial(self.execute_call, nnn)
             case InstructionType.JUMP_EQ_NN:
-                self.execute_jump_eq_nn()
+                handler = partial(self.execute_jump_eq_nn, x, nn)
             case InstructionType.JUMP_NEQ_NN:
-                self.execute_jump_neq_nn()
+                handler = partial(self.execute_jump_neq_nn, x, nn)
             case InstructionType.JUMP_NEQ:
-                self.execute_jump_neq()
+                handler = partial(self.execute_jump_neq, x, y)
             case InstructionType.JUMP_EQ:
-                self.execute_jump_eq()
+                handler = partial(self.execute_jump_eq, x, y)
             case InstructionType.COPY:
-                self.execute_copy()
+                handler = partial(self.execute_copy, x, y)
             case InstructionType.BINARY_OR:
-                self.execute_or()
+                handler = partial(self.execute_or_reset_vf if self.quirks.logic_resets_vf else self.execute_or, x, y)
             case InstructionType.BINARY_AND:
-                self.execute_and()
+                handler = partial(self.execute_and_reset_vf if self.quirks.logic_resets_vf else self.execute_and, x, y)
             case InstructionType.LOGICAL_XOR:
-                self.execute_xor()
+                handler = partial(self.execute_xor_reset_vf if self.quirks.logic_resets_vf else self.execute_xor, x, y)
             case InstructionType.ADD:
-                self.execute_add()
+                handler = partial(self.execute_add, x, y)
             case InstructionType.SUBTRACT:
-                self.execute_substract()
+                handler = partial(self.execute_substract, x, y)
             case InstructionType.ISUBTRACT:
-                self.execute_isubstract()
+                handler = partial(self.execute_isubstract, x, y)
             case InstructionType.LSHIFT:
-                self.execute_shift_left()
+                handler = partial(self.execute_shift_left, x, y if self.quirks.shift_uses_vy else x)
             case InstructionType.RSHIFT:
-                self.execute_shift_right()
+                handler = partial(self.execute_shift_right, x, y if self.quirks.shift_uses_vy else x)
             case InstructionType.RANDOM:
-                self.execute_random()
+                handler = partial(self.execute_random, x, nn)
             case InstructionType.JUMP_OFFSET:
-                self.execute_jump_with_offset()
+                handler = partial(self.execute_jump_with_offset, nnn, x if self.quirks.jump_uses_vx else 0)
             case InstructionType.ADD_INDEX:
-                self.execute_add_index()
+                handler = partial(self.execute_add_index, x)
             case InstructionType.GET_KEY:
-                self.execute_get_key()
+                handler = partial(self.execute_get_key, x)
             case InstructionType.SKIP_IF_KEY:
-                self.execute_skip_if_key()
+                handler = partial(self.execute_skip_if_key, x)
             case InstructionType.SKIP_IF_NOT_KEY:
-                self.execute_skip_if_not_key()
+                handler = partial(self.execute_skip_if_not_key, x)
             case InstructionType.FONT:
-                self.execute_font()
+                handler = partial(self.execute_font, x)
             case InstructionType.BINARY_CODED_DECIMAL:
-                self.execute_binary_coded_decimal()
+                handler = partial(self.execute_binary_coded_decimal, x)
             case InstructionType.STORE:
-                self.execute_store()
+                handler = partial(self.execute_store, x, x + 1 if self.quirks.load_store_increments_i else 0)
             case InstructionType.LOAD:
-                self.execute_load()
+                handler = partial(self.execute_load, x, x + 1 if self.quirks.load_store_increments_i else 0)
             case InstructionType.SET_BEAP_TIMER:
-                self.execute_beap_timer()
+                handler = partial(self.execute_beap_timer, x)
             case InstructionType.SET_DELAY_TIMER:
-                self.execute_set_delay_timer()
+                handler = partial(self.execute_set_delay_timer, x)
             case InstructionType.READ_DELAY_TIMER:
-                self.execute_read_delay_timer()
-            case InstructionType.UNKNOWN:
-                print("UNKNOWN Instruction")
+                handler = partial(self.execute_read_delay_timer, x)
+            case InstructionType.SCROLL_DOWN:
+                handler = partial(self.execute_scroll_down, n)
+            case InstructionType.SCROLL_UP:
+                handler = partial(self.execute_scroll_up, n)
+            case InstructionType.SCROLL_RIGHT:
+                handler = self.execute_scroll_right
+            case InstructionType.SCROLL_LEFT:
+                handler = self.execute_scroll_left
+            case InstructionType.EXIT:
+                handler = self.execute_exit
+            case InstructionType.LORES:
+                handler = partial(self.execute_set_resolution, 64, 32)
+            case InstructionType.HIRES:
+                handler = partial(self.execute_set_resolution, 128, 64)
+            case InstructionType.DISPLAY_LARGE:
+                handler = partial(self.execute_display_large, x, y, self.quirks.sprite_wrap)
+            case InstructionType.BIG_FONT:
+                handler = partial(self.execute_big_font, x)
+            case InstructionType.SAVE_FLAGS:
+                handler = partial(self.execute_save_flags, x)
+            case InstructionType.LOAD_FLAGS:
+                handler = partial(self.execute_load_flags, x)
+            case InstructionType.SAVE_RANGE:
+                handler = partial(self.execute_save_range, x, y)
+            case InstructionType.LOAD_RANGE:
+                handler = partial(self.execute_load_range, x, y)
+            case InstructionType.LONG_INDEX:
+                handler = self.execute_long_index
+            case InstructionType.SELECT_PLANE:
+                handler = partial(self.execute_select_plane, x)
+            case InstructionType.LOAD_AUDIO:
+                handler = self.execute_load_audio
+            case InstructionType.SET_PITCH:
+                handler = partial(self.execute_set_pitch, x)
             case _:
-                print("should not happen: " + str(self.current_instruction.t))
+                handler = self.execute_unknown
+        
+        if xochip:
+            # XO-CHIP draws and clears on the selected planes, and skips step over F000 NNNN
+            match ins.t:
+                case InstructionType.DISPLAY:
+                    handler = partial(self.execute_display_planes, x, y, n, self.quirks.sprite_wrap)
+                case InstructionType.CLEAR:
+                    handler = self.execute_clear_planes
+                case (InstructionType.JUMP_EQ_NN | InstructionType.JUMP_NEQ_NN | InstructionType.JUMP_EQ |
+                      InstructionType.JUMP_NEQ | InstructionType.SKIP_IF_KEY | InstructionType.SKIP_IF_NOT_KEY):
+                    handler = partial(self.execute_skip_long, handler)
+        
+        self.decode_table[opcode] = handler
+        return handler
+    
+    def step(self):
+        chip8 = self.chip8
+        pc = chip8.pc
+        opcode = (chip8.memory[pc] << 8) | chip8.memory[pc + 1]
+        chip8.pc = pc + 2
+        
+        handler = self.decode_table[opcode]
+        if handler is None:
+            handler = self.decode(opcode)
+        handler()
     
-    def execute_jump(self):
-        # print("JUMP:" + str((self.current_instruction.lower_b1 << 8) | self.current_instruction.b2))
-        self.chip8.pc = (self.current_instruction.lower_b1 << 8) | self.current_instruction.b2
+    def run_instructions(self, count):
+        if self.block_compiler is not None:
+            self.instructions_run += self.block_compiler.run(count)
+            return
+        step = self.step
+        executed = 0
+        skipped = 0
+        loop_found_at = None
+        while executed < count:
+            try:
+                for executed in range(executed, count):
+                    step()
+                executed = count
+            except IdleLoop:
+                # the jump that raised has run; the second sighting gives the loop length
+                executed += 1
+                if loop_found_at is None:
+                    loop_found_at = executed
+                    continue
+                length = executed - loop_found_at
+                skip = (count - executed) // length * length
+                executed += skip
+                skipped += skip
+                loop_found_at = None
+            except WaitForKey:
+                executed += 1
+                break
+        self.idle_instructions += skipped
+        self.instructions_run += executed - skipped
     
-    def execute_set_register(self):
-        # print("SET REGISTER: " + str(self.current_instruction.lower_b1))
-        self.chip8.registers[self.current_instruction.lower_b1] = self.current_instruction.b2
+    def is_idle_loop_body(self, start, end):
+        key = (start, end)
+        idle = self.idle_loop_bodies.get(key)
+        if idle is None:
+            memory = self.chip8.memory
+            idle = all(decode((memory[pc] << 8) | memory[pc + 1], self.quirks.opcodes).t in IDLE_LOOP_TYPES for pc in range(start, end, 2))
+            self.idle_loop_bodies[key] = idle
+        return idle
     
-    def execute_add_register(self):
-        # print("Add Register: " + str(self.current_instruction.lower_b1))
-        res = (self.chip8.registers[self.current_instruction.lower_b1] + self.current_instruction.b2) & 0xFF        
-        self.chip8.registers[self.current_instruction.lower_b1] = res
-        
-    def execute_set_index_register(self):
-        # print("SET Index REGISTER" + str ((self.current_instruction.lower_b1 << 8) | self.current_instruction.b2))
-        self.chip8.index_register = (self.current_instruction.lower_b1 << 8) | self.current_instruction.b2
+    def set_quirks(self, quirks):
+        # handlers have the quirks baked in, so everything decoded so far is stale
+        self.quirks = quirks
+        self.decode_table = [None] * 0x10000
+        self.invalidate_caches()
+    
+    def invalidate_caches(self):
+        # after memory was replaced wholesale, e.g. by loading a save state
+        self.idle_loop_bodies.clear()
+        self.last_loop_state = None
+        if self.block_compiler is not None:
+            self.block_compiler.reset()
+    
+    def enable_block_compiler(self):
+        from blockCompiler import BlockCompiler
+        self.block_compiler = BlockCompiler(self)
+    
+    def prewarm(self, analysis=None):
+        # decode (and compile) everything reachable up front instead of on first execution
+        if analysis is None:
+            from disassembler import analyse
+            analysis = analyse(self.chip8.memory, opcodes=self.quirks.opcodes, entries=[self.chip8.pc])
+        memory = self.chip8.memory
+        table = self.decode_table
+        for pc in analysis.code:
+            opcode = (memory[pc] << 8) | memory[pc + 1]
+            if table[opcode] is None:
+                table[opcode] = self.decode(opcode)
+        if self.block_compiler is not None:
+            self.block_compiler.prewarm(analysis.blocks)
+        return analysis
+    
+    def execute_unknown(self):
+        print("UNKNOWN Instruction")
+    
+    def execute_jump(self, nnn):
+        self.chip8.pc = nnn
+        self.last_loop_state = None
+    
+    def execute_jump_detect_idle(self, nnn):
+        chip8 = self.chip8
+        jump = chip8.pc - 2
+        chip8.pc = nnn
+        if nnn > jump or not self.is_idle_loop_body(nnn, jump):
+            # control left the loop, the next sighting has to fall through its body again
+            self.last_loop_state = None
+            return
+        # the loop can only touch registers and I, so if those repeat it spins until the next frame
+        state = (nnn, jump, bytes(chip8.registers), chip8.index_register)
+        if state == self.last_loop_state:
+            raise IdleLoop()
+        self.last_loop_state = state
+    
+    def execute_set_register(self, x, nn):
+        self.chip8.registers[x] = nn
+    
+    def execute_add_register(self, x, nn):
+        registers = self.chip8.registers
+        registers[x] = (registers[x] + nn) & 0xFF
         
+    def execute_set_index_register(self, nnn):
+        self.chip8.index_register = nnn
     
     def execute_clear(self):
-        # print("CLEAR")
         self.display.clear()
+    
+    def execute_clear_planes(self):
+        for plane in self.active_planes:
+            plane.clear()
         
-    def execute_display(self):
-        # print("DISPLAY")
-        x = self.chip8.registers[self.current_instruction.lower_b1] % self.display.reg_width
-        y = self.chip8.registers[self.current_instruction.upper_b2] % self.display.reg_height
-        n = self.current_instruction.lower_b2
+    def execute_display(self, x, y, n):
+        registers = self.chip8.registers
+        framebuffer = self.display.framebuffer
+        ir = self.chip8.index_register
+        sprite = self.chip8.memory[ir:ir + n]
         
+        collision = framebuffer.draw_sprite(registers[x] % framebuffer.width, registers[y] % framebuffer.height, sprite)
+        registers[0xf] = 0x1 if collision else 0x0
+    
+    def execute_display_wrapped(self, x, y, n):
+        registers = self.chip8.registers
+        framebuffer = self.display.framebuffer
         ir = self.chip8.index_register
-
-        self.chip8.registers[0xf] = 0x0
-        for j in range(n):
-            sprite = self.chip8.memory[ir + j]
-            for i in range(8):
-                bit = (sprite >> 7-i) & 1
-                if bit == 1:
-                    if x + i >= self.display.reg_width:
-                        break
-                    if self.display.flip_pixel(int(x) + i, int(y)):
-                        self.chip8.registers[0xf] = 0x1
-                
-            y+=1
-            offset = 0
-            if y >= self.display.reg_height:
-                break
-            # print(offset)
-            
+        sprite = self.chip8.memory[ir:ir + n]
+        
+        collision = framebuffer.draw_sprite_wrapped(registers[x] % framebuffer.width, registers[y] % framebuffer.height, sprite)
+        registers[0xf] = 0x1 if collision else 0x0
         
     def execute_return(self):
-        if self.chip8.stack != []:
-            self.chip8.pc = self.chip8.stack.pop()
+        chip8 = self.chip8
+        if chip8.sp > 0:
+            chip8.sp -= 1
+            chip8.pc = chip8.stack[chip8.sp]
+        self.last_loop_state = None
     
-    def execute_call(self):
-        self.chip8.stack.append(self.chip8.pc)
-        self.chip8.pc = (self.current_instruction.lower_b1 << 8) | self.current_instruction.b2
+    def execute_call(self, nnn):
+        chip8 = self.chip8
+        if chip8.sp == STACK_DEPTH:
+            raise IndexError(f"stack overflow calling {nnn:#05x}")
+        chip8.stack[chip8.sp] = chip8.pc
+        chip8.sp += 1
+        chip8.pc = nnn
+        self.last_loop_state = None
         
-    def execute_jump_eq_nn(self):
-        x = self.chip8.registers[self.current_instruction.lower_b1]
-        n = self.current_instruction.b2
-        
-        if x == n:
+    def execute_jump_eq_nn(self, x, nn):
+        if self.chip8.registers[x] == nn:
             self.chip8.pc += 2 
             
-    def execute_jump_neq_nn(self):
-        x = self.chip8.registers[self.current_instruction.lower_b1]
-        n = self.current_instruction.b2
-        
-        if x != n:
+    def execute_jump_neq_nn(self, x, nn):
+        if self.chip8.registers[x] != nn:
             self.chip8.pc += 2 
     
-    def execute_jump_eq(self):
-        x = self.chip8.registers[self.current_instruction.lower_b1]
-        y = self.chip8.registers[self.current_instruction.upper_b2]
-        
-        if x == y:
+    def execute_jump_eq(self, x, y):
+        registers = self.chip8.registers
+        if registers[x] == registers[y]:
             self.chip8.pc += 2 
     
-    def execute_jump_neq(self):
-        x = self.chip8.registers[self.current_instruction.lower_b1]
-        y = self.chip8.registers[self.current_instruction.upper_b2]
-        
-        if x != y:
+    def execute_jump_neq(self, x, y):
+        registers = self.chip8.registers
+        if registers[x] != registers[y]:
             self.chip8.pc += 2 
     
-    def execute_copy(self):
-        self.chip8.registers[self.current_instruction.lower_b1] = self.chip8.registers[self.current_instruction.upper_b2]
+    def execute_copy(self, x, y):
+        registers = self.chip8.registers
+        registers[x] = registers[y]
     
-    def execute_or(self):
-        x = self.chip8.registers[self.current_instruction.lower_b1]
-        y = self.chip8.registers[self.current_instruction.upper_b2]
-        
-        self.chip8.registers[self.current_instruction.lower_b1] = x | y
+    def execute_or(self, x, y):
+        registers = self.chip8.registers
+        registers[x] = registers[x] | registers[y]
     
-    def execute_and(self):
-        x = self.chip8.registers[self.current_instruction.lower_b1]
-        y = self.chip8.registers[self.current_instruction.upper_b2]
-        
-        self.chip8.registers[self.current_instruction.lower_b1] = x & y 
+    def execute_and(self, x, y):
+        registers = self.chip8.registers
+        registers[x] = registers[x] & registers[y]
 
-    def execute_xor(self):
-        x = self.chip8.registers[self.current_instruction.lower_b1]
-        y = self.chip8.registers[self.current_instruction.upper_b2]
-        
-        self.chip8.registers[self.current_instruction.lower_b1] = x ^ y
+    def execute_xor(self, x, y):
+        registers = self.chip8.registers
+        registers[x] = registers[x] ^ registers[y]
+    
+    def execute_or_reset_vf(self, x, y):
+        registers = self.chip8.registers
+        registers[x] = registers[x] | registers[y]
+        registers[0xf] = 0
+    
+    def execute_and_reset_vf(self, x, y):
+        registers = self.chip8.registers
+        registers[x] = registers[x] & registers[y]
+        registers[0xf] = 0
+    
+    def execute_xor_reset_vf(self, x, y):
+        registers = self.chip8.registers
+        registers[x] = registers[x] ^ registers[y]
+        registers[0xf] = 0
         
-    def execute_add(self):
-        x = self.chip8.registers[self.current_instruction.lower_b1]
-        y = self.chip8.registers[self.current_instruction.upper_b2]
-        z = x + y
+    def execute_add(self, x, y):
+        registers = self.chip8.registers
+        z = registers[x] + registers[y]
         
         if z > 255:
-            self.chip8.registers[0xf] = 1
+            registers[0xf] = 1
         else:
-            self.chip8.registers[0xf] = 0
+            registers[0xf] = 0
             
-        self.chip8.registers[self.current_instruction.lower_b1] = z & 0xFF
+        registers[x] = z & 0xFF
     
-    def execute_substract(self):
-        x = self.chip8.registers[self.current_instruction.lower_b1]
-        y = self.chip8.registers[self.current_instruction.upper_b2]
+    def execute_substract(self, x, y):
+        registers = self.chip8.registers
+        vx = registers[x]
+        vy = registers[y]
         
-        if x > y:
-            self.chip8.registers[0xf] = 1
+        if vx >= vy:
+            registers[0xf] = 1
         else:
-            self.chip8.registers[0xf] = 0
+            registers[0xf] = 0
         
-        self.chip8.registers[self.current_instruction.lower_b1] = (x - y) & 0xFF
+        registers[x] = (vx - vy) & 0xFF
     
-    def execute_isubstract(self):
-        x = self.chip8.registers[self.current_instruction.lower_b1]
-        y = self.chip8.registers[self.current_instruction.upper_b2]
+    def execute_isubstract(self, x, y):
+        registers = self.chip8.registers
+        vx = registers[x]
+        vy = registers[y]
         
-        if y > x:
-            self.chip8.registers[0xf] = 1
+        if vy >= vx:
+            registers[0xf] = 1
         else:
-            self.chip8.registers[0xf] = 0
+            registers[0xf] = 0
         
-        self.chip8.registers[self.current_instruction.lower_b1] = (y - x) & 0xFF
+        registers[x] = (vy - vx) & 0xFF
     
-    def execute_shift_right(self):
-        self.chip8.registers[0xf] = self.chip8.registers[self.current_instruction.lower_b1] & 0x1
-        self.chip8.registers[self.current_instruction.lower_b1] >>= 1
+    def execute_shift_right(self, x, source):
+        registers = self.chip8.registers
+        value = registers[source]
+        registers[0xf] = value & 0x1
+        registers[x] = value >> 1
     
-    def execute_shift_left(self):
-        self.chip8.registers[0xf] = (self.chip8.registers[self.current_instruction.lower_b1] >> 7) & 0x1
-        self.chip8.registers[self.current_instruction.lower_b1] <<= 1 & 0xFF
+    def execute_shift_left(self, x, source):
+        registers = self.chip8.registers
+        value = registers[source]
+        registers[0xf] = (value >> 7) & 0x1
+        registers[x] = (value << 1) & 0xFF
         
-    def execute_jump_with_offset(self):
-        self.chip8.pc = (self.current_instruction.lower_b1 << 8) | self.current_instruction.b2
-        self.chip8.pc += self.chip8.registers[0x0]
+    def execute_jump_with_offset(self, nnn, offset_register):
+        self.chip8.pc = nnn + self.chip8.registers[offset_register]
+        self.last_loop_state = None
         
-    def execute_random(self):
-        ran = random.random() * self.current_instruction.b2
-        self.chip8.registers[self.current_instruction.lower_b1] = ran & self.current_instruction.b2
+    def execute_random(self, x, nn):
+        self.chip8.registers[x] = self.random.randrange(256) & nn
     
-    def execute_add_index(self):
-        x = self.chip8.registers[self.current_instruction.lower_b1]
-        self.chip8.index_register += x
+    def execute_add_index(self, x):
+        self.chip8.index_register += self.chip8.registers[x]
         
         self.chip8.registers[0xF] = 1 if self.chip8.index_register > 0x0FFF else 0
         self.chip8.index_register &= 0x0FFF
         
-    def execute_get_key(self):
-        # print(self.is_key_pressed)
-        # print(self.key)
-        if self.is_key_pressed and self.key is not None:
-            self.chip8.registers[self.current_instruction.lower_b1] = self.key
-        else:
-            self.chip8.pc -= 2
-    
-    def execute_skip_if_key(self):
-        if self.is_key_pressed and self.key is not None:
-            x = self.chip8.registers[self.current_instruction.lower_b1]
-            print(self.is_key_pressed)
-            if x == self.key:
-                self.chip8.pc += 2    
-    
-    def execute_skip_if_not_key(self):
-        if self.is_key_pressed and self.key is not None:
-            x = self.chip8.registers[self.current_instruction.lower_b1]
-            if x == self.key:
-                return
-            
-        self.chip8.pc += 2
+    def execute_get_key(self, x):
+        # the CPU stops here until step_frame sees a key released
+        if self.waiting_register is None:
+            self.waiting_register = x
+            self.keypad.begin_wait()
+        self.chip8.pc -= 2
+        raise WaitForKey()
+    
+    def execute_skip_if_key(self, x):
+        if self.keypad.is_pressed(self.chip8.registers[x]):
+            self.chip8.pc += 2
     
+    def execute_skip_if_not_key(self, x):
+        if not self.keypad.is_pressed(self.chip8.registers[x]):
+            self.chip8.pc += 2
     
-    def execute_font(self):
-        x = self.chip8.registers[self.current_instruction.lower_b1]
-        char = x & 0x0F
+    def execute_font(self, x):
+        char = self.chip8.registers[x] & 0x0F
         self.chip8.index_register = (char * 5) + self.chip8.font_offset
     
-    def execute_binary_coded_decimal(self):
-        x = self.chip8.registers[self.current_instruction.lower_b1]
-        d3 = x % 10
-        d2 = (x // 10) % 10
-        d1 = (x // 100) % 10
-        self.chip8.memory[self.chip8.index_register] = d1
-        self.chip8.memory[self.chip8.index_register + 1] = d2
-        self.chip8.memory[self.chip8.index_register + 2] = d3
-    
-    def execute_load(self):
-        for i in range(self.current_instruction.lower_b1 + 1):
-            self.chip8.registers[i] = self.chip8.memory[self.chip8.index_register + i]
+    def execute_binary_coded_decimal(self, x):
+        vx = self.chip8.registers[x]
+        memory = self.chip8.memory
+        ir = self.chip8.index_register
+        memory[ir] = (vx // 100) % 10
+        memory[ir + 1] = (vx // 10) % 10
+        memory[ir + 2] = vx % 10
+        if self.block_compiler is not None:
+            self.block_compiler.invalidate(ir, 3)
+        if self.idle_loop_bodies:
+            self.idle_loop_bodies.clear()
+    
+    def execute_load(self, x, increment):
+        ir = self.chip8.index_register
+        for i in range(x + 1):
+            self.chip8.registers[i] = self.chip8.memory[ir + i]
+        self.chip8.index_register = ir + increment
 
-    def execute_store(self):
-        for i in range(self.current_instruction.lower_b1 + 1):
-            self.chip8.memory[self.chip8.index_register + i] = self.chip8.registers[i]
+    def execute_store(self, x, increment):
+        ir = self.chip8.index_register
+        for i in range(x + 1):
+            self.chip8.memory[ir + i] = self.chip8.registers[i]
+        self.chip8.index_register = ir + increment
+        if self.block_compiler is not None:
+            self.block_compiler.invalidate(ir, x + 1)
+        if self.idle_loop_bodies:
+            self.idle_loop_bodies.clear()
     
-    def execute_set_delay_timer(self):
-        self.delay_timer_interval = time.perf_counter()
-        self.chip8.delay_timer = self.chip8.registers[self.current_instruction.lower_b1]
+    def execute_set_delay_timer(self, x):
+        self.chip8.delay_timer = self.chip8.registers[x]
 
-    def execute_beap_timer(self):
-        self.sound_timer_interval = time.perf_counter()
-        self.chip8.sound_timer = self.chip8.registers[self.current_instruction.lower_b1]
-    
-    def execute_read_delay_timer(self):
-        self.chip8.registers[self.current_instruction.lower_b1] = self.chip8.delay_timer
-    
-    def run(self):
-        while True:
-            event = sdl2.SDL_Event()
-            while sdl2.SDL_PollEvent(event):
-                if event.type == sdl2.SDL_QUIT:
-                    return
-                
-                elif event.type == sdl2.SDL_KEYDOWN:
-                    self.is_key_pressed = True
-                    self.key = self.display.get_key(event.key.keysym.sym)
-                    print("Key down:", self.key)
-            
-            self.fetch()
-            self.dispatch()
-            self.execute()
-            
-            
-            t = time.perf_counter()
-            
-            if self.chip8.delay_timer > 0:
-                if t - self.delay_timer_interval >= (1/60):
-                    self.delay_timer_interval += 1/60
-                    self.chip8.delay_timer -= 1
-            
-            if self.chip8.sound_timer > 0:
-                self.display.play_sound()
-                if t - self.sound_timer_interval >= (1/60):
-                    self.sound_timer_interval += 1/60
-                    self.chip8.sound_timer -= 1
-            
+    def execute_beap_timer(self, x):
+        self.chip8.sound_timer = self.chip8.registers[x]
+    
+    def execute_read_delay_timer(self, x):
+        self.chip8.registers[x] = self.chip8.delay_timer
+    
+    def execute_skip_long(self, handler):
+        chip8 = self.chip8
+        pc = chip8.pc
+        handler()
+        if chip8.pc == pc + 2 and chip8.memory[pc] == 0xF0 and chip8.memory[pc + 1] == 0x00:
+            chip8.pc += 2
+    
+    def execute_scroll_down(self, n):
+        for plane in self.active_planes:
+            plane.scroll_down(n)
+    
+    def execute_scroll_up(self, n):
+        for plane in self.active_planes:
+            plane.scroll_up(n)
+    
+    def execute_scroll_right(self):
+        for plane in self.active_planes:
+            plane.scroll_right(4)
+    
+    def execute_scroll_left(self):
+        for plane in self.active_planes:
+            plane.scroll_left(4)
+    
+    def execute_exit(self):
+        self.exited = True
+        self.chip8.pc -= 2
+    
+    def execute_set_resolution(self, width, height):
+        self.display.set_resolution(width, height)
+    
+    def execute_display_planes(self, x, y, n, wrapped):
+        registers = self.chip8.registers
+        memory = self.chip8.memory
+        ir = self.chip8.index_register
+        collision = False
+        for plane in self.active_planes:
+            draw = plane.draw_sprite_wrapped if wrapped else plane.draw_sprite
+            if draw(registers[x] % plane.width, registers[y] % plane.height, memory[ir:ir + n]):
+                collision = True
+            ir += n
+        registers[0xf] = 0x1 if collision else 0x0
+    
+    def execute_display_large(self, x, y, wrapped):
+        registers = self.chip8.registers
+        memory = self.chip8.memory
+        ir = self.chip8.index_register
+        collision = False
+        for plane in self.active_planes:
+            draw = plane.draw_sprite_wrapped if wrapped else plane.draw_sprite
+            sprite = [(memory[i] << 8) | memory[i + 1] for i in range(ir, min(ir + 32, len(memory) - 1), 2)]
+            if draw(registers[x] % plane.width, registers[y] % plane.height, sprite, 16):
+                collision = True
+            ir += 32
+        registers[0xf] = 0x1 if collision else 0x0
+    
+    def execute_big_font(self, x):
+        char = self.chip8.registers[x] & 0x0F
+        self.chip8.index_register = (char * 10) + self.chip8.big_font_offset
+    
+    def execute_save_flags(self, x):
+        self.flags[0:x + 1] = self.chip8.registers[0:x + 1]
+    
+    def execute_load_flags(self, x):
+        self.chip8.registers[0:x + 1] = self.flags[0:x + 1]
+    
+    def execute_save_range(self, x, y):
+        step = 1 if x <= y else -1
+        ir = self.chip8.index_register
+        for i, r in enumerate(range(x, y + step, step)):
+            self.chip8.memory[ir + i] = self.chip8.registers[r]
+        if self.block_compiler is not None:
+            self.block_compiler.invalidate(ir, abs(y - x) + 1)
+        if self.idle_loop_bodies:
+            self.idle_loop_bodies.clear()
+    
+    def execute_load_range(self, x, y):
+        step = 1 if x <= y else -1
+        ir = self.chip8.index_register
+        for i, r in enumerate(range(x, y + step, step)):
+            self.chip8.registers[r] = self.chip8.memory[ir + i]
+    
+    def execute_long_index(self):
+        chip8 = self.chip8
+        chip8.index_register = (chip8.memory[chip8.pc] << 8) | chip8.memory[chip8.pc + 1]
+        chip8.pc += 2
+    
+    def execute_select_plane(self, x):
+        self.plane_mask = x & 0x3
+        self.active_planes = [plane for i, plane in enumerate(self.display.planes) if self.plane_mask & (1 << i)]
+    
+    def execute_load_audio(self):
+        ir = self.chip8.index_register
+        self.audio_pattern = bytes(self.chip8.memory[ir:ir + 16])
+        self.audio.set_tone(self.audio_pattern, self.pitch)
+    
+    def execute_set_pitch(self, x):
+        self.pitch = self.chip8.registers[x]
+        self.audio.set_tone(self.audio_pattern, self.pitch)
+    
+    def step_frame(self):
+        if not self.begin_frame():
+            return False
+        if self.waiting_register is None:
+            # timers and keys only change between frames
+            self.last_loop_state = None
+            self.run_instructions(self.instructions_per_frame)
+        return self.end_frame()
+    
+    def begin_frame(self):
+        self.frame_events = self.display.poll_events()
+        for event, key in self.frame_events:
+            if event == "quit":
+                return False
+            self.keypad.handle(event, key)
+        
+        if self.waiting_register is not None and self.keypad.released is not None:
+            self.chip8.registers[self.waiting_register] = self.keypad.released
+            self.chip8.pc += 2
+            self.waiting_register = None
+        return True
+    
+    def end_frame(self):
+        if self.exited:
+            return False
+        
+        chip8 = self.chip8
+        if chip8.delay_timer > 0:
+            chip8.delay_timer -= 1
+        
+        if chip8.sound_timer > 0:
+            if not self.sound_on:
+                self.sound_on = True
+                self.audio.start()
+            self.audio.update()
+            chip8.sound_timer -= 1
+        elif self.sound_on:
+            self.sound_on = False
+            self.audio.stop()
+        
+        self.display.present()
+        self.frame_count += 1
+        for listener in self.frame_listeners:
+            listener()
+        return True
+    
+    def run(self, frames=None):
+        frame_time = 1 / FRAME_RATE
+        deadline = time.perf_counter()
+        while frames is None or self.frame_count < frames:
+            if not self.step_frame():
+                return
             
-            if t - self.clear_key >= (1/60):
-                self.key = None
-                self.is_key_pressed = False
-                self.clear_key = t
\ No newline at end of file
+            if self.paced:
+                deadline += frame_time
+                remaining = deadline - time.perf_counter()
+                if remaining > 0:
+                    time.sleep(remaining)
+                elif remaining < -frame_time:
+                    # fell more than a frame behind, don't try to catch up
+                    deadline = time.perf_counter()
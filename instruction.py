@@ -1,6 +1,8 @@
 from enum import Enum, auto
 
 class Instruction:
+    __slots__ = ("b1", "b2", "upper_b1", "lower_b1", "upper_b2", "lower_b2", "opcode", "nnn", "t")
+    
     def __init__(self, b1, b2):
         self.b1 = b1
         self.b2 = b2
@@ -10,6 +12,9 @@ class Instruction:
         
         self.upper_b2 = (b2 & 0xF0) >> 4
         self.lower_b2 = b2 & 0x0F
+
+        self.opcode = (b1 << 8) | b2
+        self.nnn = (self.lower_b1 << 8) | b2
         
         self.t = None
         
@@ -48,4 +53,169 @@ class InstructionType(Enum):
     LOAD = auto()
     SET_DELAY_TIMER = auto()
     READ_DELAY_TIMER = auto()
-    SET_BEAP_TIMER = auto()
\ No newline at end of file
+    SET_BEAP_TIMER = auto()
+    # SUPER-CHIP
+    SCROLL_DOWN = auto()
+    SCROLL_RIGHT = auto()
+    SCROLL_LEFT = auto()
+    EXIT = auto()
+    LORES = auto()
+    HIRES = auto()
+    DISPLAY_LARGE = auto()
+    BIG_FONT = auto()
+    SAVE_FLAGS = auto()
+    LOAD_FLAGS = auto()
+    # XO-CHIP
+    SCROLL_UP = auto()
+    SAVE_RANGE = auto()
+    LOAD_RANGE = auto()
+    LONG_INDEX = auto()
+    SELECT_PLANE = auto()
+    LOAD_AUDIO = auto()
+    SET_PITCH = auto()
+
+# instruction sets understood by decode(), each a superset of the previous one
+CHIP8 = "chip8"
+SCHIP = "schip"
+XOCHIP = "xochip"
+
+def decode(opcode, opcodes=CHIP8):
+    ins = Instruction(opcode >> 8, opcode & 0xFF)
+    ins.t = InstructionType.UNKNOWN
+    if opcodes != CHIP8 and decode_extended(ins, opcodes):
+        return ins
+    match ins.upper_b1:
+        case 0x0:
+            if ins.lower_b2 == 0x0:
+                ins.t = InstructionType.CLEAR
+            elif ins.lower_b2 == 0xE:
+                ins.t = InstructionType.RETURN
+        case 0x2:
+            ins.t = InstructionType.CALL
+        case 0x1:
+            ins.t = InstructionType.JUMP
+        case 0x3:
+            ins.t = InstructionType.JUMP_EQ_NN
+        case 0x4:
+            ins.t = InstructionType.JUMP_NEQ_NN
+        case 0x5:
+            ins.t = InstructionType.JUMP_EQ
+        case 0x6:
+            ins.t = InstructionType.SET_REGISTER
+        case 0x7:
+            ins.t = InstructionType.ADD_REGISTER
+        case 0x8:
+            match ins.lower_b2:
+                case 0x0:
+                    ins.t = InstructionType.COPY
+                case 0x1:
+                    ins.t = InstructionType.BINARY_OR
+                case 0x2:
+                    ins.t = InstructionType.BINARY_AND
+                case 0x3:
+                    ins.t = InstructionType.LOGICAL_XOR
+                case 0x4:
+                    ins.t = InstructionType.ADD
+                case 0x5:
+                    ins.t = InstructionType.SUBTRACT
+                case 0x6:
+                    ins.t = InstructionType.RSHIFT
+                case 0x7:
+                    ins.t = InstructionType.ISUBTRACT
+                case 0xE:
+                    ins.t = InstructionType.LSHIFT
+        case 0x9:
+            ins.t = InstructionType.JUMP_NEQ
+        case 0xA:
+            ins.t = InstructionType.SET_INDEX_REGISTER
+        case 0xB:
+            ins.t = InstructionType.JUMP_OFFSET
+        case 0xC:
+            ins.t = InstructionType.RANDOM
+        case 0xD:
+            ins.t = InstructionType.DISPLAY
+        case 0xE:
+            if ins.b2 == 0x9E:
+                ins.t = InstructionType.SKIP_IF_KEY
+            elif ins.b2 == 0xA1:
+                ins.t = InstructionType.SKIP_IF_NOT_KEY
+        case 0xF:
+            match ins.b2:
+                case 0x1E:
+                    ins.t = InstructionType.ADD_INDEX
+                case 0x0A:
+                    ins.t = InstructionType.GET_KEY
+                case 0x29:
+                    ins.t = InstructionType.FONT
+                case 0x33:
+                    ins.t = InstructionType.BINARY_CODED_DECIMAL
+                case 0x55:
+                    ins.t = InstructionType.STORE
+                case 0x65:
+                    ins.t = InstructionType.LOAD
+                case 0x07:
+                    ins.t = InstructionType.READ_DELAY_TIMER
+                case 0x15:
+                    ins.t = InstructionType.SET_DELAY_TIMER
+                case 0x18:
+                    ins.t = InstructionType.SET_BEAP_TIMER
+    return ins
+
+
+def decode_extended(ins, opcodes):
+    match ins.upper_b1:
+        case 0x0:
+            if ins.b1 != 0x00:
+                return True
+            match ins.b2:
+                case 0xE0:
+                    ins.t = InstructionType.CLEAR
+                case 0xEE:
+                    ins.t = InstructionType.RETURN
+                case 0xFB:
+                    ins.t = InstructionType.SCROLL_RIGHT
+                case 0xFC:
+                    ins.t = InstructionType.SCROLL_LEFT
+                case 0xFD:
+                    ins.t = InstructionType.EXIT
+                case 0xFE:
+                    ins.t = InstructionType.LORES
+                case 0xFF:
+                    ins.t = InstructionType.HIRES
+                case _ if ins.upper_b2 == 0xC:
+                    ins.t = InstructionType.SCROLL_DOWN
+                case _ if ins.upper_b2 == 0xD and opcodes == XOCHIP:
+                    ins.t = InstructionType.SCROLL_UP
+            return True
+        case 0x5 if opcodes == XOCHIP:
+            match ins.lower_b2:
+                case 0x0:
+                    ins.t = InstructionType.JUMP_EQ
+                case 0x2:
+                    ins.t = InstructionType.SAVE_RANGE
+                case 0x3:
+                    ins.t = InstructionType.LOAD_RANGE
+            return True
+        case 0xD if ins.lower_b2 == 0x0:
+            ins.t = InstructionType.DISPLAY_LARGE
+            return True
+        case 0xF:
+            match ins.b2:
+                case 0x30:
+                    ins.t = InstructionType.BIG_FONT
+                case 0x75:
+                    ins.t = InstructionType.SAVE_FLAGS
+                case 0x85:
+                    ins.t = InstructionType.LOAD_FLAGS
+                case 0x00 if opcodes == XOCHIP and ins.lower_b1 == 0x0:
+                    ins.t = InstructionType.LONG_INDEX
+                case 0x01 if opcodes == XOCHIP:
+                    ins.t = InstructionType.SELECT_PLANE
+                case 0x02 if opcodes == XOCHIP and ins.lower_b1 == 0x0:
+                    ins.t = InstructionType.LOAD_AUDIO
+                case 0x3A if opcodes == XOCHIP:
+                    ins.t = InstructionType.SET_PITCH
+                case _:
+                    return False
+            return True
+    return False
@@ -0,0 +1,29 @@
+class Keypad:
+    def __init__(self):
+        # bit k is set while key k is held
+        self.state = 0
+        # last key released since begin_wait(), for FX0A
+        self.released = None
+    
+    def press(self, key):
+        self.state |= 1 << key
+    
+    def release(self, key):
+        bit = 1 << key
+        if self.state & bit:
+            self.state &= ~bit
+            self.released = key
+    
+    def is_pressed(self, key):
+        return key < 16 and (self.state >> key) & 1 == 1
+    
+    def begin_wait(self):
+        self.released = None
+    
+    def handle(self, event, key):
+        if key is None:
+            return
+        if event == "keydown":
+            self.press(key)
+        elif event == "keyup":
+            self.release(key)
@@ -1,10 +1,104 @@
+import argparse
+import os
 import chip8
-import display
 import instrucionExecutor
-import sys
+import quirks
+
+def speed(value):
+    if value == "unlimited":
+        return None
+    if value == "auto":
+        return value
+    return int(value)
+
+parser = argparse.ArgumentParser(description="CHIP-8 emulator")
+parser.add_argument("rom")
+parser.add_argument("--headless", action="store_true", help="run without a window or sound")
+parser.add_argument("--speed", type=speed, default="auto", help="instructions per second, 'unlimited' to run frames without sleeping, or 'auto' for the catalogue's recommendation")
+parser.add_argument("--ipf", type=int, default=None, help="instructions per 60 Hz frame, overrides the per-second rate")
+parser.add_argument("--quirks", choices=["auto"] + list(quirks.PROFILES), default="auto", help="platform behaviour, 'auto' looks the ROM up in the catalogue")
+parser.add_argument("--jit", action="store_true", help="compile straight-line blocks into Python functions")
+parser.add_argument("--prewarm", action="store_true", help="disassemble the ROM first and decode (and compile) all reachable code before running")
+parser.add_argument("--no-idle-skip", action="store_true", help="execute idle loops instead of skipping to the next frame")
+parser.add_argument("--frames", type=int, default=None, help="stop after this many frames")
+parser.add_argument("--profile", action="store_true", help="print per-instruction timings and hot addresses on exit")
+parser.add_argument("--folded", metavar="PATH", help="write flamegraph folded stacks to PATH, implies --profile")
+parser.add_argument("--seed", type=int, default=None, help="seed for CXNN")
+parser.add_argument("--record", metavar="PATH", help="record key presses and the RNG seed to PATH")
+parser.add_argument("--capture", metavar="PATH", help="write every changed frame to PATH: .gif, .raw, or a directory of PNGs")
+parser.add_argument("--capture-scale", type=int, default=1, help="pixel size for --capture images")
+parser.add_argument("--debug", metavar="PORT", type=int, help="serve the JSON-lines debugger on localhost:PORT instead of running")
+parser.add_argument("--replay", metavar="PATH", help="replay a recording headlessly at full speed")
+parser.add_argument("--catalogue", metavar="PATH", help="ROM catalogue file, defaults to catalogue.json next to the ROM")
+args = parser.parse_args()
+if args.replay:
+    import replay
+    player = replay.InputReplay(args.replay)
+    args.headless = True
+    args.speed = None
+    # the recording decides the platform, so prewarmed caches match what it runs
+    args.quirks = player.quirks.name
+
 chip = chip8.Chip8()
-disp = display.Display()
+if args.headless:
+    import headlessDisplay
+    disp = headlessDisplay.HeadlessDisplay()
+    sound = None
+else:
+    import display
+    import audio
+    disp = display.Display()
+    sound = audio.Audio()
+
+program = chip.load_program(args.rom)
+if args.quirks == "auto" or args.speed == "auto":
+    import romCatalogue
+    catalogue = romCatalogue.RomCatalogue(os.path.dirname(args.rom) or ".", args.catalogue)
+    entry = catalogue.entry_for(args.rom, program)
+    if args.quirks == "auto":
+        args.quirks = entry["quirks"]
+    if args.speed == "auto":
+        args.speed = entry["speed"]
+profile = quirks.PROFILES[args.quirks]
+executor = instrucionExecutor.InstructionExecutor(chip, disp, args.speed or 700, paced=args.speed is not None, seed=args.seed,
+                                                 skip_idle_loops=not args.no_idle_skip, quirks=profile, audio=sound)
+if args.ipf is not None:
+    executor.instructions_per_frame = args.ipf
+if args.jit:
+    executor.enable_block_compiler()
+if args.prewarm:
+    executor.prewarm()
+if args.profile or args.folded:
+    from profiler import Profiler
+    profiler = Profiler(executor).attach()
+
+if args.capture:
+    import frameSink
+    sink = frameSink.FrameSink(executor, frameSink.writer_for(args.capture, args.capture_scale))
+
+if args.debug is not None:
+    import debugger
+    if debugger.DebugServer(debugger.Debugger(executor), port=args.debug).serve():
+        executor.run(args.frames)
+elif args.replay:
+    player.attach(executor)
+    player.run()
+elif args.record:
+    import replay
+    recorder = replay.InputRecorder(executor)
+    try:
+        executor.run(args.frames)
+    finally:
+        recorder.save(args.record)
+else:
+    executor.run(args.frames)
+
+if args.profile or args.folded:
+    print(profiler.report())
+    if args.folded:
+        profiler.write_folded(args.folded)
 
-chip.load_program(sys.argv[1])
-executor = instrucionExecutor.InstructionExecutor(chip, disp)
-executor.run()
\ No newline at end of file
+if args.capture:
+    sink.close()
+    if sink.dropped:
+        print(f"capture dropped {sink.dropped} frames")
@@ -0,0 +1,25 @@
+class NullAudio:
+    # keeps track of the tone without making any sound, for headless runs
+    def __init__(self):
+        self.playing = False
+        self.pattern = None
+        self.pitch = None
+        self.sound_frames = 0
+        self.starts = 0
+    
+    def set_tone(self, pattern, pitch):
+        self.pattern = pattern
+        self.pitch = pitch
+    
+    def start(self):
+        self.playing = True
+        self.starts += 1
+    
+    def stop(self):
+        self.playing = False
+    
+    def update(self):
+        self.sound_frames += 1
+    
+    def destroy(self):
+        self.playing = False
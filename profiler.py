@@ -0,0 +1,105 @@
+import time
+from collections import defaultdict
+from instruction import InstructionType, decode
+
+
+class Profiler:
+    # wraps the decoded handlers while attached, so a detached profiler costs nothing
+    def __init__(self, executor):
+        self.executor = executor
+        self.counts = defaultdict(int)
+        self.times = defaultdict(float)
+        self.pcs = defaultdict(int)
+        # (loop start, branch address) -> times the backward branch was taken
+        self.loops = defaultdict(int)
+        # (return addresses on the stack, pc) -> instructions executed there
+        self.stacks = defaultdict(int)
+        self.decode_handler = None
+        self.block_compiler = None
+    
+    def attach(self):
+        executor = self.executor
+        self.decode_handler = executor.decode
+        self.block_compiler = executor.block_compiler
+        executor.block_compiler = None
+        executor.decode = self.decode
+        executor.decode_table = [None] * 0x10000
+        return self
+    
+    def detach(self):
+        executor = self.executor
+        executor.decode = self.decode_handler
+        executor.decode_table = [None] * 0x10000
+        executor.block_compiler = self.block_compiler
+        if self.block_compiler is not None:
+            self.block_compiler.reset()
+    
+    def decode(self, opcode):
+        handler = self.decode_handler(opcode)
+        t = decode(opcode, self.executor.quirks.opcodes).t
+        chip8 = self.executor.chip8
+        counts = self.counts
+        times = self.times
+        pcs = self.pcs
+        loops = self.loops
+        stacks = self.stacks
+        perf_counter = time.perf_counter
+        follows_loops = t not in (InstructionType.CALL, InstructionType.RETURN)
+        
+        def profiled():
+            pc = chip8.pc - 2
+            start = perf_counter()
+            try:
+                handler()
+            finally:
+                # IdleLoop and WaitForKey leave through here but the instruction still ran
+                times[t] += perf_counter() - start
+                counts[t] += 1
+                pcs[pc] += 1
+                stacks[(tuple(chip8.stack[:chip8.sp]), pc)] += 1
+                if follows_loops and chip8.pc <= pc:
+                    loops[(chip8.pc, pc)] += 1
+        
+        self.executor.decode_table[opcode] = profiled
+        return profiled
+    
+    def hot_pcs(self, limit=10):
+        return sorted(self.pcs.items(), key=lambda item: item[1], reverse=True)[:limit]
+    
+    def hot_loops(self, limit=10):
+        return sorted(self.loops.items(), key=lambda item: item[1], reverse=True)[:limit]
+    
+    def folded_stacks(self):
+        # frames are named after the subroutine each return address was called into
+        memory = self.executor.chip8.memory
+        folded = defaultdict(int)
+        for (stack, pc), count in self.stacks.items():
+            frames = ["main"]
+            for ret in stack:
+                call = (memory[ret - 2] << 8) | memory[ret - 1]
+                frames.append(f"sub_{call & 0xFFF:03x}")
+            frames.append(f"{pc:03x}")
+            folded[";".join(frames)] += count
+        return [f"{frames} {count}" for frames, count in sorted(folded.items())]
+    
+    def write_folded(self, path):
+        with open(path, "w") as f:
+            for line in self.folded_stacks():
+                f.write(line + "\n")
+    
+    def report(self, limit=10):
+        total = sum(self.counts.values())
+        lines = [f"{'instruction':24} {'count':>12} {'%':>6} {'total ms':>10} {'ns/op':>8}"]
+        for t in sorted(self.counts, key=self.times.get, reverse=True):
+            count = self.counts[t]
+            lines.append(f"{t.name:24} {count:12} {count / total * 100:6.1f} "
+                         f"{self.times[t] * 1000:10.2f} {self.times[t] / count * 1e9:8.0f}")
+        lines.append("")
+        lines.append("hot addresses")
+        for pc, count in self.hot_pcs(limit):
+            lines.append(f"  {pc:#05x} {count:12}")
+        lines.append("")
+        lines.append("hot loops")
+        for (start, end), count in self.hot_loops(limit):
+            lines.append(f"  {start:#05x}-{end:#05x} {count:12}")
+        return "\n".join(lines)
@@ -0,0 +1,48 @@
+import hashlib
+from instruction import CHIP8, SCHIP, XOCHIP
+
+
+class Quirks:
+    # the defaults are the behaviour this emulator has always had
+    def __init__(self, name="default", shift_uses_vy=False, jump_uses_vx=False,
+                 load_store_increments_i=False, logic_resets_vf=False, sprite_wrap=False, opcodes=CHIP8):
+        self.name = name
+        # instruction set to decode: CHIP8, SCHIP or XOCHIP
+        self.opcodes = opcodes
+        # 8XY6/8XYE shift VY into VX instead of shifting VX in place
+        self.shift_uses_vy = shift_uses_vy
+        # BXNN jumps to XNN + VX instead of BNNN jumping to NNN + V0
+        self.jump_uses_vx = jump_uses_vx
+        # FX55/FX65 leave I pointing past the last register copied
+        self.load_store_increments_i = load_store_increments_i
+        # 8XY1/8XY2/8XY3 clear VF
+        self.logic_resets_vf = logic_resets_vf
+        # DXYN wraps sprites around the screen edges instead of clipping them
+        self.sprite_wrap = sprite_wrap
+    
+    def __repr__(self):
+        return f"Quirks({self.name!r})"
+
+
+PROFILES = {
+    "default": Quirks(),
+    "chip8": Quirks("chip8", shift_uses_vy=True, load_store_increments_i=True, logic_resets_vf=True),
+    "schip": Quirks("schip", jump_uses_vx=True, opcodes=SCHIP),
+    "xochip": Quirks("xochip", shift_uses_vy=True, load_store_increments_i=True, sprite_wrap=True, opcodes=XOCHIP),
+}
+
+# SHA-1 of known ROMs -> profile they were written for
+ROM_PROFILES = {
+    "cf3a8c546038c63cd4cc1de8d171b9bf0d57c0ee": "chip8",  # 15-Puzzle
+    "b3fed4ed1eb0ed693c9731dbe53b29a76236c781": "chip8",  # Bowling
+    "72e8f3a10a32bd7fb91322ecab87249f95e81e57": "chip8",  # Lunar Lander (Udo Pernisz, 1979)
+}
+
+
+def rom_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def profile_for_rom(path):
+    return PROFILES[ROM_PROFILES.get(rom_hash(path), "default")]
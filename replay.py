@@ -0,0 +1,72 @@
+import struct
+from collections import defaultdict
+import quirks
+
+MAGIC = b"C8RP"
+VERSION = 3
+# magic, version, rng seed, instructions per frame, frame count, quirks profile name
+HEADER = struct.Struct(">4sBQHI16s")
+# frame, key with RELEASED set for key up
+EVENT = struct.Struct(">IB")
+RELEASED = 0x80
+
+
+class InputRecorder:
+    def __init__(self, executor):
+        self.executor = executor
+        self.events = []
+        executor.frame_listeners.append(self.capture)
+    
+    def capture(self):
+        frame = self.executor.frame_count - 1
+        for event, key in self.executor.frame_events:
+            if key is None:
+                continue
+            if event == "keydown":
+                self.events.append((frame, key))
+            elif event == "keyup":
+                self.events.append((frame, key | RELEASED))
+    
+    def save(self, path):
+        executor = self.executor
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, executor.seed, executor.instructions_per_frame, executor.frame_count,
+                                executor.quirks.name.encode()))
+            for frame, key in self.events:
+                f.write(EVENT.pack(frame, key))
+
+
+class InputReplay:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, self.seed, self.instructions_per_frame, self.frames, profile = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a CHIP-8 input recording")
+        self.quirks = quirks.PROFILES[profile.rstrip(b"\0").decode()]
+        self.events = defaultdict(list)
+        for frame, key in EVENT.iter_unpack(data[HEADER.size:]):
+            self.events[frame].append(key)
+        self.executor = None
+    
+    def attach(self, executor):
+        # the display must accept scripted keys, i.e. a HeadlessDisplay
+        self.executor = executor
+        executor.seed = self.seed
+        executor.random.seed(self.seed)
+        executor.instructions_per_frame = self.instructions_per_frame
+        if executor.quirks is not self.quirks:
+            executor.set_quirks(self.quirks)
+        executor.frame_listeners.append(self.feed)
+        self.feed()
+    
+    def feed(self):
+        display = self.executor.display
+        for key in self.events.get(self.executor.frame_count, ()):
+            if key & RELEASED:
+                display.release_key(key & ~RELEASED)
+            else:
+                display.press_key(key)
+    
+    def run(self):
+        self.executor.run(self.frames)
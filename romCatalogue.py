@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+from quirks import ROM_PROFILES
+from instruction import CHIP8, SCHIP, XOCHIP
+
+CATALOGUE_NAME = "catalogue.json"
+VERSION = 1
+# platform a ROM was written for, going by its extension
+EXTENSIONS = {".ch8": CHIP8, ".sc8": SCHIP, ".xo8": XOCHIP}
+# recommended instructions per second for each platform
+SPEEDS = {CHIP8: 700, SCHIP: 1800, XOCHIP: 60000}
+
+
+class RomCatalogue:
+    # indexes a ROM directory by SHA-1 and keeps the result next to the ROMs
+    def __init__(self, directory="roms", path=None):
+        self.directory = directory
+        self.path = path if path is not None else os.path.join(directory, CATALOGUE_NAME)
+        # sha1 -> title, platform, quirks and speed
+        self.roms = {}
+        # file name -> [size, mtime_ns, sha1], so unchanged files are not hashed again
+        self.files = {}
+        self.changed = False
+        self.load()
+    
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == VERSION:
+            self.roms = data["roms"]
+            self.files = data["files"]
+    
+    def save(self):
+        if not self.changed:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": VERSION, "roms": self.roms, "files": self.files}, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+        self.changed = False
+    
+    def scan(self):
+        seen = set()
+        for entry in os.scandir(self.directory):
+            name = entry.name
+            if not entry.is_file() or os.path.splitext(name)[1].lower() not in EXTENSIONS:
+                continue
+            seen.add(name)
+            stat = entry.stat()
+            cached = self.files.get(name)
+            if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+                continue
+            with open(entry.path, "rb") as f:
+                sha1 = self.add(name, f.read())
+            self.files[name] = [stat.st_size, stat.st_mtime_ns, sha1]
+            self.changed = True
+        for name in set(self.files) - seen:
+            del self.files[name]
+            self.changed = True
+    
+    def add(self, name, program):
+        sha1 = hashlib.sha1(program).hexdigest()
+        if sha1 not in self.roms:
+            stem, extension = os.path.splitext(name)
+            platform = EXTENSIONS.get(extension.lower(), CHIP8)
+            self.roms[sha1] = {
+                "title": stem,
+                "platform": platform,
+                # ROMs that are not known keep the emulator's default behaviour
+                "quirks": ROM_PROFILES.get(sha1, "default" if platform == CHIP8 else platform),
+                "speed": SPEEDS[platform],
+            }
+            self.changed = True
+        return sha1
+    
+    def lookup(self, sha1):
+        return self.roms.get(sha1)
+    
+    def entry_for(self, path, program=None):
+        if program is None:
+            with open(path, "rb") as f:
+                program = f.read()
+        sha1 = hashlib.sha1(program).hexdigest()
+        entry = self.lookup(sha1)
+        if entry is None:
+            # a ROM that is not indexed yet, pick up anything else new in its directory too
+            if os.path.isdir(self.directory):
+                self.scan()
+            entry = self.lookup(sha1)
+            if entry is None:
+                self.add(os.path.basename(path), program)
+                entry = self.lookup(sha1)
+            try:
+                self.save()
+            except OSError:
+                # a read-only ROM directory only costs the next launch a rescan
+                pass
+        return entry
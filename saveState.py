@@ -0,0 +1,205 @@
+import struct
+import zlib
+from array import array
+from collections import deque
+from chip8 import STACK_OFFSET
+
+MAGIC = b"C8SS"
+VERSION = 6
+# magic, version, pc, index register, delay timer, sound timer, frame count,
+# held keys, FX0A register and last released key (0xFF for none), stack depth
+HEADER = struct.Struct(">4sBHHBBIHBBB")
+# width, height, plane count and selected plane mask
+FRAMEBUFFER_HEADER = struct.Struct(">HHBB")
+# random.Random.getstate(): version, the 624 Mersenne Twister words and the index, then a cached gauss value if any
+RANDOM_STATE = struct.Struct(">B625I?d")
+# XO-CHIP audio pattern and pitch
+AUDIO = struct.Struct(">16sB")
+
+
+def snapshot(executor):
+    chip8 = executor.chip8
+    planes = executor.display.planes
+    framebuffer = planes[0]
+    row_bytes = framebuffer.width // 8
+    parts = [
+        HEADER.pack(MAGIC, VERSION, chip8.pc, chip8.index_register, chip8.delay_timer,
+                    chip8.sound_timer, executor.frame_count, executor.keypad.state,
+                    0xFF if executor.waiting_register is None else executor.waiting_register,
+                    0xFF if executor.keypad.released is None else executor.keypad.released,
+                    chip8.sp),
+        struct.pack(f">{chip8.sp}H", *chip8.stack[:chip8.sp]),
+        # memory followed by the registers, one copy out of the core's state buffer
+        chip8.state[:STACK_OFFSET],
+        bytes(executor.flags),
+        FRAMEBUFFER_HEADER.pack(framebuffer.width, framebuffer.height, len(planes), executor.plane_mask),
+        b"".join(row.to_bytes(row_bytes, "big") for plane in planes for row in plane.rows),
+        pack_random(executor.random.getstate()),
+        AUDIO.pack(executor.audio_pattern, executor.pitch),
+    ]
+    return zlib.compress(b"".join(parts), 1)
+
+
+def restore(executor, data):
+    data = zlib.decompress(data)
+    magic, version, pc, index_register, delay_timer, sound_timer, frame_count, keys, waiting, released, depth = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a CHIP-8 save state")
+    offset = HEADER.size
+    stack = list(struct.unpack_from(f">{depth}H", data, offset))
+    offset += 2 * depth
+    
+    chip8 = executor.chip8
+    state = data[offset:offset + STACK_OFFSET]
+    offset += STACK_OFFSET
+    flags = data[offset:offset + len(executor.flags)]
+    offset += len(executor.flags)
+    
+    planes = executor.display.planes
+    width, height, plane_count, plane_mask = FRAMEBUFFER_HEADER.unpack_from(data, offset)
+    offset += FRAMEBUFFER_HEADER.size
+    if plane_count != len(planes):
+        raise ValueError(f"save state has {plane_count} planes, display has {len(planes)}")
+    row_bytes = width // 8
+    plane_rows = []
+    for _ in range(plane_count):
+        plane_rows.append([int.from_bytes(data[offset + y * row_bytes:offset + (y + 1) * row_bytes], "big") for y in range(height)])
+        offset += height * row_bytes
+    random_state = unpack_random(data, offset)
+    offset += RANDOM_STATE.size
+    pattern, pitch = AUDIO.unpack_from(data, offset)
+    
+    chip8.pc = pc
+    chip8.index_register = index_register
+    chip8.delay_timer = delay_timer
+    chip8.sound_timer = sound_timer
+    chip8.stack[:depth] = array("H", stack)
+    chip8.sp = depth
+    chip8.state[:STACK_OFFSET] = state
+    executor.flags[:] = flags
+    if (width, height) != (planes[0].width, planes[0].height):
+        executor.display.set_resolution(width, height)
+    for plane, rows in zip(planes, plane_rows):
+        set_framebuffer(plane, rows)
+    executor.execute_select_plane(plane_mask)
+    executor.frame_count = frame_count
+    executor.keypad.state = keys
+    executor.waiting_register = None if waiting == 0xFF else waiting
+    executor.keypad.released = None if released == 0xFF else released
+    executor.random.setstate(random_state)
+    set_sound(executor, pattern, pitch)
+    executor.invalidate_caches()
+
+
+def set_sound(executor, pattern, pitch):
+    executor.audio_pattern = pattern
+    executor.pitch = pitch
+    executor.audio.set_tone(pattern, pitch)
+    # the tone plays while the sound timer runs, end_frame only acts on edges from here on
+    playing = executor.chip8.sound_timer > 0
+    if playing != executor.sound_on:
+        executor.sound_on = playing
+        if playing:
+            executor.audio.start()
+        else:
+            executor.audio.stop()
+
+
+def pack_random(state):
+    version, words, gauss = state
+    return RANDOM_STATE.pack(version, *words, gauss is not None, gauss or 0.0)
+
+
+def unpack_random(data, offset):
+    values = RANDOM_STATE.unpack_from(data, offset)
+    return values[0], values[1:-2], values[-1] if values[-2] else None
+
+
+def save(executor, path):
+    with open(path, "wb") as f:
+        f.write(snapshot(executor))
+
+
+def load(executor, path):
+    with open(path, "rb") as f:
+        restore(executor, f.read())
+
+
+def set_framebuffer(framebuffer, rows):
+    framebuffer.rows = list(rows)
+    framebuffer.dirty.update(range(framebuffer.height))
+
+
+class RewindBuffer:
+    # keeps the last `capacity` frames as undo deltas of the memory pages that changed
+    def __init__(self, executor, capacity=600, page_size=256):
+        self.executor = executor
+        self.page_size = page_size
+        self.frames = deque(maxlen=capacity)
+        self.shadow = bytearray(executor.chip8.memory)
+        self.capture()
+    
+    def core_state(self):
+        chip8 = self.executor.chip8
+        return (chip8.pc, chip8.index_register, chip8.delay_timer, chip8.sound_timer,
+                tuple(chip8.stack[:chip8.sp]), bytes(chip8.registers),
+                self.executor.display.planes[0].width, self.executor.display.planes[0].height,
+                tuple(tuple(plane.rows) for plane in self.executor.display.planes),
+                self.executor.plane_mask, bytes(self.executor.flags), self.executor.frame_count,
+                self.executor.keypad.state, self.executor.keypad.released, self.executor.waiting_register,
+                self.executor.audio_pattern, self.executor.pitch, self.random_state())
+    
+    def random_state(self):
+        state = self.executor.random.getstate()
+        # frames that drew no random numbers share the previous tuple instead of holding a copy each
+        if self.frames and self.frames[-1][0][-1] == state:
+            return self.frames[-1][0][-1]
+        return state
+    
+    def capture(self):
+        memory = self.executor.chip8.memory
+        shadow = self.shadow
+        size = self.page_size
+        pages = []
+        for start in range(0, len(memory), size):
+            end = start + size
+            if memory[start:end] != shadow[start:end]:
+                pages.append((start, bytes(shadow[start:end])))
+                shadow[start:end] = memory[start:end]
+        self.frames.append((self.core_state(), pages))
+    
+    def rewind(self, frames=1):
+        if frames >= len(self.frames):
+            raise ValueError(f"only {len(self.frames) - 1} frames can be rewound")
+        shadow = self.shadow
+        for _ in range(frames):
+            _, pages = self.frames.pop()
+            for start, old in reversed(pages):
+                shadow[start:start + len(old)] = old
+        
+        (pc, index_register, delay_timer, sound_timer, stack, registers, width, height, plane_rows,
+         plane_mask, flags, frame_count, keys, released, waiting, pattern, pitch, random_state) = self.frames[-1][0]
+        executor = self.executor
+        chip8 = executor.chip8
+        chip8.pc = pc
+        chip8.index_register = index_register
+        chip8.delay_timer = delay_timer
+        chip8.sound_timer = sound_timer
+        chip8.stack[:len(stack)] = array("H", stack)
+        chip8.sp = len(stack)
+        chip8.registers[:] = registers
+        chip8.memory[:] = shadow
+        planes = executor.display.planes
+        if (width, height) != (planes[0].width, planes[0].height):
+            executor.display.set_resolution(width, height)
+        for plane, rows in zip(planes, plane_rows):
+            set_framebuffer(plane, rows)
+        executor.execute_select_plane(plane_mask)
+        executor.flags[:] = flags
+        executor.frame_count = frame_count
+        executor.keypad.state = keys
+        executor.keypad.released = released
+        executor.waiting_register = waiting
+        executor.random.setstate(random_state)
+        set_sound(executor, pattern, pitch)
+        executor.invalidate_caches()
@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+import chip8
+import headlessDisplay
+import instrucionExecutor
+import quirks
+from instrucionExecutor import FRAME_RATE
+
+# stop sending frames to a client whose socket has this much unsent data
+WRITE_BUFFER_LIMIT = 256 * 1024
+# a frame runs synchronously on the event loop, so no session may ask for more than XO-CHIP's speed
+MAX_SPEED = 60000
+
+
+class Session:
+    # one player's machine, stepped a frame at a time by the host
+    def __init__(self, session_id, rom, profile, instructions_per_second):
+        self.id = session_id
+        chip = chip8.Chip8()
+        chip.load_program(rom)
+        self.display = headlessDisplay.HeadlessDisplay()
+        self.executor = instrucionExecutor.InstructionExecutor(chip, self.display, instructions_per_second,
+                                                               paced=False, quirks=profile)
+        # CPU seconds the session may still spend, topped up every tick
+        self.balance = 0.0
+        self.cpu_time = 0.0
+        # ticks the session had no budget left for
+        self.throttled = 0
+        self.running = True
+        # (width, height, rows of every plane) as the client last saw them
+        self.sent = None
+    
+    def key(self, key, down):
+        if type(key) is not int or key not in range(16):
+            raise ValueError(f"key must be 0-15, not {key!r}")
+        if type(down) is not bool:
+            raise ValueError(f"down must be true or false, not {down!r}")
+        if down:
+            self.display.press_key(key)
+        else:
+            self.display.release_key(key)
+    
+    def step(self):
+        start = time.perf_counter()
+        self.running = self.executor.step_frame()
+        elapsed = time.perf_counter() - start
+        self.balance -= elapsed
+        self.cpu_time += elapsed
+    
+    def delta(self):
+        planes = self.display.planes
+        width, height = planes[0].width, planes[0].height
+        current = [list(plane.rows) for plane in planes]
+        if self.sent is None or self.sent[:2] != (width, height):
+            # first frame or a resolution change, send everything
+            changed = [list(range(height)) for _ in planes]
+        else:
+            changed = [[y for y in range(height) if rows[y] != sent[y]] for rows, sent in zip(current, self.sent[2])]
+            if not any(changed):
+                return None
+        self.sent = (width, height, current)
+        row_digits = width // 4
+        return {
+            "type": "frame",
+            "frame": self.executor.frame_count,
+            "width": width,
+            "height": height,
+            # plane -> row -> hex of the packed row, leftmost pixel in the top bit
+            "planes": [{y: f"{rows[y]:0{row_digits}x}" for y in ys} for rows, ys in zip(current, changed)],
+        }
+
+
+class SessionHost:
+    def __init__(self, rom_dir="roms", budget=0.004, max_sessions=256, instructions_per_second=700):
+        self.rom_dir = rom_dir
+        # CPU seconds each session earns per frame
+        self.budget = budget
+        self.max_sessions = max_sessions
+        self.instructions_per_second = instructions_per_second
+        # session id -> (Session, stream writer)
+        self.sessions = {}
+        self.ids = itertools.count(1)
+        # where the next tick starts, so sessions late in the order aren't always the ones cut short
+        self.offset = 0
+    
+    def open_session(self, request):
+        name = request["rom"]
+        if os.path.basename(name) != name:
+            raise ValueError(f"{name!r} is not a ROM name")
+        if len(self.sessions) >= self.max_sessions:
+            raise ValueError("host is full")
+        path = os.path.join(self.rom_dir, name)
+        profile_name = request.get("quirks", "auto")
+        profile = quirks.profile_for_rom(path) if profile_name == "auto" else quirks.PROFILES[profile_name]
+        speed = request.get("speed", self.instructions_per_second)
+        if type(speed) not in (int, float) or not speed > 0:
+            raise ValueError(f"speed must be a positive number, not {speed!r}")
+        return Session(next(self.ids), path, profile, min(speed, MAX_SPEED))
+    
+    async def handle_client(self, reader, writer):
+        session = None
+        try:
+            while line := await reader.readline():
+                if session is not None and session.id not in self.sessions:
+                    # the machine exited or crashed in tick(), which already told the client
+                    session = None
+                try:
+                    request = json.loads(line)
+                    match request["cmd"]:
+                        case "open" if session is None:
+                            session = self.open_session(request)
+                            self.sessions[session.id] = (session, writer)
+                            reply = {"type": "session", "id": session.id}
+                        case "key" if session is not None:
+                            session.key(request["key"], request["down"])
+                            continue
+                        case "stats" if session is not None:
+                            reply = {"type": "stats", "frame": session.executor.frame_count,
+                                     "cpu_time": session.cpu_time, "throttled": session.throttled}
+                        case "close":
+                            break
+                        case command:
+                            raise ValueError(f"unexpected command {command!r}")
+                except (ValueError, KeyError, TypeError, OSError) as e:
+                    reply = {"type": "error", "error": f"{type(e).__name__}: {e}"}
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+        finally:
+            if session is not None:
+                self.sessions.pop(session.id, None)
+            writer.close()
+    
+    def tick(self, deadline):
+        entries = list(self.sessions.values())
+        if not entries:
+            return
+        self.offset %= len(entries)
+        order = entries[self.offset:] + entries[:self.offset]
+        for i, (session, writer) in enumerate(order):
+            if time.perf_counter() > deadline:
+                # out of time, carry on from this session next tick
+                self.offset += i
+                return
+            # unspent budget carries over a little, so short spikes don't cost a frame
+            session.balance = min(session.balance + self.budget, 4 * self.budget)
+            if session.balance <= 0:
+                session.throttled += 1
+                continue
+            try:
+                session.step()
+                error = None
+            except Exception as e:
+                # a ROM that crashes the interpreter only ends its own session
+                session.running = False
+                error = f"{type(e).__name__}: {e}"
+            if not session.running:
+                self.sessions.pop(session.id, None)
+                writer.write((json.dumps({"type": "exit", "frame": session.executor.frame_count, "error": error}) + "\n").encode())
+                continue
+            if writer.transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+                # the client isn't keeping up; its next delta covers everything it missed
+                continue
+            delta = session.delta()
+            if delta is not None:
+                writer.write((json.dumps(delta) + "\n").encode())
+        self.offset += 1
+    
+    async def run_frames(self):
+        frame_time = 1 / FRAME_RATE
+        next_tick = time.perf_counter()
+        while True:
+            next_tick += frame_time
+            self.tick(next_tick)
+            remaining = next_tick - time.perf_counter()
+            if remaining < -frame_time:
+                # fell more than a frame behind, don't try to catch up
+                next_tick = time.perf_counter()
+            # always yield, so clients get served even when the host is overloaded
+            await asyncio.sleep(max(remaining, 0))
+    
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.run_frames())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run one machine per connected client, stepped together at 60 Hz")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--roms", default="roms", help="directory clients can open ROMs from")
+    parser.add_argument("--budget", type=float, default=4.0, help="CPU milliseconds each session may use per frame")
+    parser.add_argument("--max-sessions", type=int, default=256)
+    args = parser.parse_args()
+    host = SessionHost(args.roms, args.budget / 1000, args.max_sessions)
+    asyncio.run(host.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
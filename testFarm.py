@@ -0,0 +1,122 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import chip8
+import headlessDisplay
+import instrucionExecutor
+import quirks
+
+ROM_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "roms")
+GOLDEN = os.path.join(ROM_DIR, "golden.json")
+
+CONFIGS = {
+    "default": {"ipf": 12},
+    "fast": {"ipf": 100},
+    "jit": {"ipf": 100, "jit": True},
+    "no-idle-skip": {"ipf": 100, "skip_idle_loops": False},
+    "chip8": {"ipf": 100, "quirks": "chip8"},
+    "schip": {"ipf": 100, "quirks": "schip"},
+    "xochip": {"ipf": 100, "quirks": "xochip"},
+}
+
+
+def job_key(rom, config, frames):
+    return f"{os.path.basename(rom)}|{config}|{frames}"
+
+
+def run_job(job):
+    rom, config_name, config, frames = job
+    chip = chip8.Chip8()
+    chip.load_program(rom)
+    display = headlessDisplay.HeadlessDisplay()
+    executor = instrucionExecutor.InstructionExecutor(chip, display, paced=False, seed=config.get("seed", 0),
+                                                         skip_idle_loops=config.get("skip_idle_loops", True),
+                                                         quirks=quirks.PROFILES[config.get("quirks", "default")])
+    executor.instructions_per_frame = config.get("ipf", 12)
+    if config.get("jit"):
+        executor.enable_block_compiler()
+    
+    sys.stdout = open(os.devnull, "w")
+    try:
+        executor.run(frames)
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        sys.stdout.close()
+        sys.stdout = sys.__stdout__
+    
+    planes = display.planes
+    state = hashlib.sha1()
+    state.update(bytes(chip.registers))
+    state.update(chip.pc.to_bytes(2, "big"))
+    state.update(chip.index_register.to_bytes(2, "big"))
+    state.update(bytes(chip.memory))
+    return job_key(rom, config_name, frames), {
+        "framebuffer": hashlib.sha1(b"".join(row.to_bytes(plane.width // 8, "big") for plane in planes for row in plane.rows)).hexdigest(),
+        "state": state.hexdigest(),
+        "frames": executor.frame_count,
+        "error": error,
+    }
+
+
+def make_jobs(roms, configs, frame_counts):
+    return [(rom, name, CONFIGS[name], frames) for rom in roms for name in configs for frames in frame_counts]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run ROMs headless in parallel and compare against golden hashes")
+    parser.add_argument("roms", nargs="*", help="ROM files, defaults to everything in roms/")
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument("--frames", nargs="+", type=int, default=[60, 600])
+    parser.add_argument("--golden", default=GOLDEN, help="golden results file")
+    parser.add_argument("--update", action="store_true", help="store the results as the new golden file")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+    
+    roms = args.roms or sorted(glob.glob(os.path.join(ROM_DIR, "*.ch8")))
+    jobs = make_jobs(roms, args.configs, args.frames)
+    start = time.perf_counter()
+    with Pool(args.processes) as pool:
+        results = dict(pool.imap_unordered(run_job, jobs, chunksize=max(1, len(jobs) // 64)))
+    elapsed = time.perf_counter() - start
+    print(f"{len(jobs)} runs in {elapsed:.2f}s")
+    
+    if args.update:
+        golden = {}
+        if os.path.exists(args.golden):
+            with open(args.golden) as f:
+                golden = json.load(f)
+        golden.update(results)
+        with open(args.golden, "w") as f:
+            json.dump(golden, f, indent=2, sort_keys=True)
+        print(f"updated {args.golden}")
+        return 0
+    
+    if not os.path.exists(args.golden):
+        print(f"no golden file at {args.golden}, run with --update first")
+        return 1
+    with open(args.golden) as f:
+        golden = json.load(f)
+    
+    failures = 0
+    for key in sorted(results):
+        expected = golden.get(key)
+        if expected is None:
+            print(f"NEW   {key}")
+        elif expected != results[key]:
+            failures += 1
+            changed = ", ".join(field for field in results[key] if results[key][field] != expected.get(field))
+            print(f"FAIL  {key}: {changed} changed")
+    print(f"{len(results) - failures} passed, {failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())